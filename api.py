@@ -0,0 +1,112 @@
+import json
+from datetime import date
+
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+    url_for,
+)
+
+from .database import Database, decode_cursor, encode_cursor
+
+API_LIMITE = 20
+API_LIMITE_MAX = 100
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+
+def article_json(article, contenu=True):
+    data = {
+        "id": article.id,
+        "titre": article.titre,
+        "auteur": article.auteur,
+        "auteur_id": article.auteur_id,
+        "date_publication": article.date_publication,
+        "url": url_for("article", identifiant=article.id, _external=True),
+    }
+    if contenu:
+        data["contenu"] = article.contenu
+    return data
+
+
+def erreur(message, status):
+    return jsonify({"erreur": message}), status
+
+
+def _is_date(value):
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+@api.route("/articles")
+def articles():
+    limite = request.args.get("limite", API_LIMITE, type=int)
+    limite = min(max(limite, 1), API_LIMITE_MAX)
+    filtres = {
+        "auteur": request.args.get("auteur", "").strip() or None,
+        "auteur_id": request.args.get("auteur_id", type=int),
+        "date_debut": request.args.get("date_debut") or None,
+        "date_fin": request.args.get("date_fin") or None,
+    }
+    for nom in ("date_debut", "date_fin"):
+        if filtres[nom] is not None and not _is_date(filtres[nom]):
+            return erreur(f"{nom} doit avoir le format AAAA-MM-JJ.", 400)
+    apres = request.args.get("apres")
+    curseur = decode_cursor(apres) if apres else None
+    if apres and curseur is None:
+        return erreur("Curseur invalide.", 400)
+
+    database_path = current_app.config["DATABASE"]
+
+    # The page is written as SQLite returns the rows; the cursor of the
+    # next page comes last, once it is known.
+    def generate():
+        db = Database(database_path)
+        rows = db.iter_published_articles(limite, curseur, **filtres)
+        suivant = None
+        try:
+            yield '{"articles": ['
+            for n, article in enumerate(rows):
+                if n == limite:
+                    suivant = encode_cursor(
+                        dernier.date_publication, dernier.id
+                    )
+                    break
+                yield (", " if n else "") + json.dumps(
+                    article_json(article), ensure_ascii=False
+                )
+                dernier = article
+        finally:
+            rows.close()
+            db.disconnect()
+        yield '], "suivant": ' + json.dumps(suivant) + "}"
+
+    return Response(
+        stream_with_context(generate()), mimetype="application/json"
+    )
+
+
+@api.route("/articles/<identifiant>")
+def article(identifiant):
+    db = Database(current_app.config["DATABASE"])
+    try:
+        article = db.get_article_with_author(identifiant)
+    finally:
+        db.disconnect()
+    # Scheduled articles stay hidden until their date, as in the list.
+    if (
+        article is None
+        or article.date_publication > date.today().isoformat()
+    ):
+        return erreur("Article introuvable.", 404)
+    response = jsonify(article_json(article))
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -1,30 +1,296 @@
 from flask import (
     Flask,
+    jsonify,
     render_template,
     request,
     redirect,
     session,
     url_for,
     Response,
-    make_response,
 )
-from .database import Database
+from .cache import PageCache, add_cache_tags, cached_page
+from .changes import ChangeFeed
+from .compression import compress_response
+from .database import Database, DATABASE_PATH, decode_cursor, get_pool
+from .limits import RateLimits
+from .metrics import METRICS, SIZE_BUCKETS
+from .migrations import db_cli
+from .api import api
+from .archive import archive_cli
+from .assets import AssetManifest, asset_response, assets_cli
+from .bench import bench_cli
+from .pictures import create_picture_store, picture_response, pictures_cli
+from .rendering import articles_cli
+from .serve import serve_command
+from .sessions import (
+    MemorySessionBackend,
+    SessionSweeper,
+    create_session_backend,
+)
+from .slowlog import SlowQueryLog
+from .suggest import TitleIndex
+from .templating import (
+    configure_templates,
+    templates_cli,
+)
+from .uploads import UploadRequest, stream_size
+from .validation import (
+    is_valid_date,
+    valider_article,
+    valider_modification_article,
+    valider_recherche,
+    valider_user,
+    valider_user_modifier,
+)
+from .writes import create_write_queue, write
 from flask import g
 from functools import wraps
+from markupsafe import Markup, escape
+from werkzeug.middleware.proxy_fix import ProxyFix
+import atexit
+import hmac
+import ipaddress
+import os
+import threading
+import time
 import uuid
-import re
+
+ARTICLES_PAR_PAGE = 5
+ARTICLES_PAR_PAGE_ADMIN = 20
+USERNAME_TAKEN = "Ce nom d'utilisateur existe déjà"
 
 app = Flask(__name__, static_url_path="", static_folder="static")
 app.secret_key = "(*&*&322387he738220)(*(*22347657"
+app.config["DATABASE"] = DATABASE_PATH
+app.config["SESSION_BACKEND"] = "memory"
+app.config["SESSION_IDLE_TIMEOUT"] = 2 * 60 * 60
+app.config["SESSION_MAX_AGE"] = 24 * 60 * 60
+app.config["SESSION_CACHE_TTL"] = 30
+app.config["SESSION_CACHE_SIZE"] = 10000
+app.config["SESSION_SWEEP_INTERVAL"] = 5 * 60
+app.config["PICTURE_MAX_AGE"] = 5 * 60
+app.config["PICTURE_STORE"] = os.environ.get("PICTURE_STORE", "database")
+app.config["PICTURE_DIRECTORY"] = os.path.join(app.root_path, "db", "photos")
+app.config["PICTURE_ACCEL_PREFIX"] = os.environ.get("PICTURE_ACCEL_PREFIX")
+# Reverse proxies (nginx) in front of the application whose
+# X-Forwarded-For and X-Forwarded-Proto are trusted.
+app.config["PROXY_COUNT"] = int(os.environ.get("PROXY_COUNT", "0"))
+app.config["PAGE_CACHE_SIZE"] = 16 * 1024 * 1024
+app.config["WRITE_BEHIND"] = os.environ.get("WRITE_BEHIND") == "1"
+app.config["WRITE_BEHIND_DELAY"] = 0.005
+app.config["WRITE_BEHIND_BATCH"] = 256
+app.config["WRITE_BEHIND_TIMEOUT"] = 10
+app.config["SLOW_QUERY_THRESHOLD"] = 0.1
+app.config["SLOW_QUERY_LOG"] = os.path.join(
+    app.root_path, "db", "requetes-lentes.jsonl"
+)
+app.config["ASSETS_DIRECTORY"] = os.path.join(
+    app.root_path, "build", "static"
+)
+app.config["COMPRESSION_MIN_SIZE"] = 1024
+app.config["COMPRESSION_LEVEL"] = 6
+app.config["COMPRESSION_ENCODINGS"] = ("gzip",)
+app.config["TEMPLATE_CACHE_DIRECTORY"] = os.path.join(
+    app.root_path, "build", "templates"
+)
+app.config["MAX_CONTENT_LENGTH"] = 4 * 1024 * 1024
+app.config["MAX_FORM_MEMORY_SIZE"] = 64 * 1024
+app.config["PICTURE_MAX_SIZE"] = 2 * 1024 * 1024
+app.config["SUGGEST_LIMIT"] = 8
+# /metrics is only served to these networks, or to a request carrying
+# "Authorization: Bearer <METRICS_TOKEN>" when a token is set.
+app.config["METRICS_ALLOWED_NETWORKS"] = ("127.0.0.0/8", "::1/128")
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+# Per endpoint: global and per-client token buckets (tokens per second and
+# burst) and requests in progress, per process. RATE_LIMITS=0 disables them.
+app.config["RATE_LIMITS"] = {
+    "login": {
+        "rate": 20, "burst": 40,
+        "client_rate": 5 / 60, "client_burst": 10,
+        "concurrency": 4,
+    },
+    "recherche": {
+        "rate": 50, "burst": 100,
+        "client_rate": 2, "client_burst": 20,
+        "concurrency": 8,
+    },
+}
+if os.environ.get("RATE_LIMITS") == "0":
+    app.config["RATE_LIMITS"] = {}
+app.request_class = UploadRequest
+if app.config["PROXY_COUNT"]:
+    # request.remote_addr is then the client, not the proxy: the rate
+    # limits are kept per client.
+    app.wsgi_app = ProxyFix(
+        app.wsgi_app,
+        x_for=app.config["PROXY_COUNT"],
+        x_proto=app.config["PROXY_COUNT"],
+    )
+app.cli.add_command(db_cli)
+app.cli.add_command(pictures_cli)
+app.cli.add_command(bench_cli)
+app.cli.add_command(archive_cli)
+app.cli.add_command(assets_cli)
+app.cli.add_command(templates_cli)
+app.cli.add_command(serve_command)
+app.cli.add_command(articles_cli)
+app.register_blueprint(api)
+
+app.extensions["changes"] = ChangeFeed()
+if app.config["SLOW_QUERY_THRESHOLD"] is not None:
+    get_pool(app.config["DATABASE"]).slow_log = SlowQueryLog(
+        app.config["SLOW_QUERY_LOG"], app.config["SLOW_QUERY_THRESHOLD"]
+    )
+if app.config["PAGE_CACHE_SIZE"]:
+    app.extensions["page_cache"] = PageCache(app.config["PAGE_CACHE_SIZE"])
+app.extensions["suggest"] = TitleIndex(app.config["DATABASE"])
+if app.config["RATE_LIMITS"]:
+    app.extensions["rate_limits"] = RateLimits(app.config["RATE_LIMITS"])
+
+app.extensions["assets"] = AssetManifest(app.config["ASSETS_DIRECTORY"])
+app.add_template_global(app.extensions["assets"].url, "asset_url")
+configure_templates(app)
+
+sweeper_lock = threading.Lock()
 
 
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        g._database = Database()
+        g._database = Database(app.config["DATABASE"])
     return g._database
 
 
+def get_writes():
+    if "writes" not in app.extensions:
+        writes = app.extensions["writes"] = create_write_queue(app.config)
+        if writes is not None:
+            atexit.register(writes.close)
+    return app.extensions["writes"]
+
+
+def get_sessions():
+    sessions = app.extensions.get("sessions")
+    if sessions is None:
+        sessions = app.extensions["sessions"] = create_session_backend(
+            app.config, get_writes()
+        )
+    return sessions
+
+
+def get_pictures():
+    pictures = app.extensions.get("pictures")
+    if pictures is None:
+        pictures = app.extensions["pictures"] = create_picture_store(
+            app.config
+        )
+    return pictures
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    # Registered first so that it runs after every other after_request.
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or "aucun"
+    labels = (("endpoint", endpoint), ("statut", response.status_code))
+    METRICS.inc("http_requests_total", labels)
+    METRICS.observe(
+        "http_request_duration_seconds",
+        labels,
+        time.perf_counter() - started,
+    )
+    if not response.is_streamed:
+        METRICS.observe(
+            "http_response_size_bytes",
+            (("endpoint", endpoint),),
+            response.calculate_content_length() or 0,
+            SIZE_BUCKETS,
+        )
+    return response
+
+
+@app.after_request
+def compress(response):
+    return compress_response(
+        response,
+        request,
+        app.config["COMPRESSION_MIN_SIZE"],
+        app.config["COMPRESSION_LEVEL"],
+        app.config["COMPRESSION_ENCODINGS"],
+    )
+
+
+@app.before_request
+def limit_request():
+    # Runs before any database work, so that a rejected request only costs
+    # a bucket lookup.
+    limits = app.extensions.get("rate_limits")
+    if limits is None:
+        return None
+    limiter, retry_after = limits.acquire(
+        request.endpoint, request.remote_addr
+    )
+    if retry_after:
+        return (
+            render_template("429.html"),
+            429,
+            {"Retry-After": str(retry_after)},
+        )
+    if limiter is not None:
+        g.rate_limiter = limiter
+
+
+@app.teardown_request
+def release_rate_limit(exception):
+    limiter = g.pop("rate_limiter", None)
+    if limiter is not None:
+        limiter.release()
+
+
+@app.before_request
+def sync_changes():
+    # Replays writes made by other worker processes (cache invalidation).
+    # The session is only read when the client has one, so that anonymous
+    # pages do not get a Vary: Cookie header.
+    seen = None
+    if app.config["SESSION_COOKIE_NAME"] in request.cookies:
+        seen = session.get("derniere_modification")
+    app.extensions["changes"].poll(get_db(), seen)
+
+
+@app.after_request
+def remember_changes(response):
+    # The page a form redirects to may be served by another worker whose
+    # feed has not seen the write yet: the client carries the id of the
+    # last change, and sync_changes() waits for it.
+    if request.method == "POST" and response.status_code in (302, 303):
+        session["derniere_modification"] = get_db().get_last_change_id()
+    return response
+
+
+@app.before_request
+def start_session_sweeper():
+    # Threads do not survive fork(), so every worker process starts its own.
+    sweeper = app.extensions.get("session_sweeper")
+    if sweeper is not None and sweeper.pid == os.getpid():
+        return
+    with sweeper_lock:
+        sweeper = app.extensions.get("session_sweeper")
+        if sweeper is None or sweeper.pid != os.getpid():
+            sweeper = SessionSweeper(
+                get_sessions(), app.config["SESSION_SWEEP_INTERVAL"]
+            )
+            app.extensions["session_sweeper"] = sweeper
+            sweeper.start()
+
+
 @app.teardown_appcontext
 def close_connection(exception):
     db = getattr(g, "_database", None)
@@ -46,35 +312,69 @@ def authentication_required(f):
 def is_authenticated(session):
     if "id" in session:
         id_session = session["id"]
-        return get_db().is_session_active(id_session)
+        return get_sessions().is_active(id_session)
     return False
 
 
 @app.route("/")
+@cached_page("articles")
 def main():
     db = get_db()
     derniers_articles = db.get_derniers_articles()
     return render_template("index.html", derniers_articles=derniers_articles)
 
 
-@app.route("/recherche", methods=["POST"])
+@app.route("/recherche", methods=["GET", "POST"])
 def recherche():
-    if request.method == "POST":
-        recherche = request.form["recherche"]
-        if valider_recherche(recherche) is not None:
-            return render_template(
-                "index.html",
-                derniers_articles=get_db().get_derniers_articles(),
-                erreur=valider_recherche(recherche),
-            )
-        db = get_db()
-        articles = db.search_articles(recherche)
+    recherche = request.values.get("recherche", "")
+    if valider_recherche(recherche) is not None:
         return render_template(
-            "recherche.html",
-            articles=articles,
-            nb_item=len(articles),
-            recherche=recherche,
+            "index.html",
+            derniers_articles=get_db().get_derniers_articles(),
+            erreur=valider_recherche(recherche),
         )
+    page = request.args.get("page", 1, type=int)
+    if page < 1:
+        page = 1
+    db = get_db()
+    articles, nb_item = db.search_articles(
+        recherche, page, ARTICLES_PAR_PAGE
+    )
+    return render_template(
+        "recherche.html",
+        articles=articles,
+        nb_item=nb_item,
+        recherche=recherche,
+        page=page,
+        nb_pages=-(-nb_item // ARTICLES_PAR_PAGE),
+    )
+
+
+@app.route("/recherche/suggest")
+def suggest():
+    prefix = request.args.get("q", "")[:50]
+    suggestions = app.extensions["suggest"].suggest(
+        prefix, app.config["SUGGEST_LIMIT"]
+    )
+    return jsonify(
+        suggestions=[
+            {
+                "id": article_id,
+                "titre": titre,
+                "url": url_for("article", identifiant=article_id),
+            }
+            for article_id, titre in suggestions
+        ]
+    )
+
+
+@app.template_filter("surligner")
+def surligner(extrait):
+    return (
+        escape(extrait)
+        .replace("\x02", Markup("<mark>"))
+        .replace("\x03", Markup("</mark>"))
+    )
 
 
 @app.route("/admin-nouveau")
@@ -105,23 +405,27 @@ def submit_article():
             )
 
         db = get_db()
-        username = db.get_session(session["id"])
-        auteur = db.get_user_fullname(username)
-        article_id = db.add_article(
+        username = get_sessions().get(session["id"])
+        auteur_id, auteur = db.get_author(username)
+        article_id = write(
+            get_writes(), db, "add_article",
             valeurs["titre"], auteur, valeurs["date_publication"],
-            valeurs["contenu"]
-        )
+            valeurs["contenu"], auteur_id
+        ).result(app.config["WRITE_BEHIND_TIMEOUT"])
         return redirect(f"/article/{article_id}")
 
 
 @app.route("/article/<identifiant>", methods=["GET"])
+@cached_page("article:{identifiant}")
 def article(identifiant):
     db = get_db()
-    article = db.get_article(identifiant)
+    article = db.get_article_with_author(identifiant)
     if article is None:
         return render_template("404.html"), 404
-    pic_id = db.get_photo(article["auteur"])
-    return render_template("article.html", article=article, pic_id=pic_id)
+    add_cache_tags(f"utilisateur:{article['auteur_id']}")
+    return render_template(
+        "article.html", article=article, pic_id=article["pic_id"]
+    )
 
 
 @app.route("/modifier-article/<identifiant>", methods=["GET", "POST"])
@@ -142,9 +446,10 @@ def modify_item(identifiant):
             valeurs["titre"], valeurs["contenu"]
         )
         if not erreurs:
-            db.modify_article(
+            write(
+                get_writes(), db, "modify_article",
                 identifiant, valeurs["titre"], valeurs["contenu"]
-            )
+            ).result(app.config["WRITE_BEHIND_TIMEOUT"])
             return redirect(f"/article/{identifiant}")
 
     return render_template(
@@ -156,9 +461,42 @@ def modify_item(identifiant):
 @app.route("/admin")
 @authentication_required
 def admin():
+    filtres = {
+        "auteur": request.args.get("auteur", "").strip(),
+        "date_debut": request.args.get("date_debut", ""),
+        "date_fin": request.args.get("date_fin", ""),
+    }
+    for nom in ("date_debut", "date_fin"):
+        if not is_valid_date(filtres[nom]):
+            filtres[nom] = ""
+    apres = request.args.get("apres")
+    avant = request.args.get("avant")
     db = get_db()
+    articles, precedent, suivant = db.get_articles_page(
+        ARTICLES_PAR_PAGE_ADMIN,
+        apres=decode_cursor(apres) if apres else None,
+        avant=decode_cursor(avant) if avant else None,
+        **filtres,
+    )
+    return render_template(
+        "admin-articles.html",
+        articles=articles,
+        filtres=filtres,
+        filtres_actifs={nom: val for nom, val in filtres.items() if val},
+        precedent=precedent,
+        suivant=suivant,
+    )
+
+
+@app.route("/admin/requetes-lentes")
+@authentication_required
+def requetes_lentes():
+    slow_log = get_pool(app.config["DATABASE"]).slow_log
+    requetes = slow_log.recent() if slow_log is not None else []
     return render_template(
-        "admin-articles.html", articles=db.get_articles_ordered_by_date()
+        "admin-requetes-lentes.html",
+        requetes=requetes,
+        seuil=app.config["SLOW_QUERY_THRESHOLD"],
     )
 
 
@@ -169,7 +507,7 @@ def login():
     db = get_db()
     if db.validate_user(username, password):
         id_session = uuid.uuid4().hex
-        db.save_session(id_session, username)
+        get_sessions().save(id_session, username)
         session["id"] = id_session
         return redirect("/admin")
     else:
@@ -178,16 +516,68 @@ def login():
         )
 
 
+@app.route("/assets/<path:filename>")
+def assets(filename):
+    return asset_response(app.config["ASSETS_DIRECTORY"], filename)
+
+
 @app.route("/image/<pic_id>.png")
 def download_picture(pic_id):
     db = get_db()
-    binary_data = db.load_picture(pic_id)
-    if binary_data is None:
+    picture = db.get_picture_info(pic_id)
+    if picture is None:
         return Response(status=404)
-    else:
-        response = make_response(binary_data)
-        response.headers.set("Content-Type", "image/png")
-    return response
+    return picture_response(picture, request, app.config)
+
+
+def metrics_autorise():
+    token = app.config["METRICS_TOKEN"]
+    authorization = request.authorization
+    if (
+        token
+        and authorization is not None
+        and authorization.type == "bearer"
+        and hmac.compare_digest(
+            (authorization.token or "").encode(), token.encode()
+        )
+    ):
+        return True
+    try:
+        adresse = ipaddress.ip_address(request.remote_addr)
+    except ValueError:
+        return False
+    return any(
+        adresse in ipaddress.ip_network(reseau)
+        for reseau in app.config["METRICS_ALLOWED_NETWORKS"]
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    if not metrics_autorise():
+        return Response(status=403)
+    gauges = [
+        (
+            "db_connections_idle",
+            (),
+            get_pool(app.config["DATABASE"]).idle_count(),
+        )
+    ]
+    cache = app.extensions.get("page_cache")
+    if cache is not None:
+        gauges.append(("page_cache_hits_total", (), cache.hits))
+        gauges.append(("page_cache_misses_total", (), cache.misses))
+        gauges.append(("page_cache_size_bytes", (), cache.size))
+    sessions = get_sessions()
+    if isinstance(sessions, MemorySessionBackend):
+        gauges.append(("session_cache_hits_total", (), sessions.hits))
+        gauges.append(("session_cache_misses_total", (), sessions.misses))
+    limits = app.extensions.get("rate_limits")
+    if limits is not None:
+        gauges.extend(limits.gauges())
+    return Response(
+        METRICS.render(gauges), mimetype="text/plain; version=0.0.4"
+    )
 
 
 @app.route("/utilisateurs")
@@ -213,11 +603,8 @@ def ajouter_utilisateur():
         valeurs["prenom"] = request.form["prenom"]
         valeurs["nom"] = request.form["nom"]
         valeurs["courriel"] = request.form["courriel"]
-        photo = None
+        photo = photo_envoyee()
         valeurs["picture_id"] = None
-        if "photo" in request.files and request.files["photo"].filename:
-            photo = request.files["photo"]
-            valeurs["picture_id"] = str(uuid.uuid4().hex)
 
         erreurs = valider_user(
             valeurs["username"],
@@ -229,22 +616,28 @@ def ajouter_utilisateur():
         )
         if len(erreurs) == 0:
             db = get_db()
-
-            if valeurs["picture_id"] is not None:
-                db.create_picture(valeurs["picture_id"], photo)
-            db.create_user(
+            picture = None
+            if photo is not None:
+                valeurs["picture_id"] = str(uuid.uuid4().hex)
+                picture = get_pictures().prepare(photo.stream)
+            identifiant = write(
+                get_writes(),
+                db,
+                "create_user",
                 valeurs["username"],
                 valeurs["password"],
                 valeurs["prenom"],
                 valeurs["nom"],
                 valeurs["courriel"],
                 valeurs["picture_id"],
-            )
-            return redirect(url_for("utilisateurs"))
-        else:
-            return render_template(
-                "ajouter-utilisateur.html", valeurs=valeurs, erreurs=erreurs
-            )
+                picture,
+            ).result(app.config["WRITE_BEHIND_TIMEOUT"])
+            if identifiant is not None:
+                return redirect(url_for("utilisateurs"))
+            erreurs["username"] = USERNAME_TAKEN
+        return render_template(
+            "ajouter-utilisateur.html", valeurs=valeurs, erreurs=erreurs
+        )
 
 
 @app.route("/modifier-utilisateur/<identifiant>", methods=["GET", "POST"])
@@ -272,17 +665,7 @@ def modifier_utilisateur(identifiant):
         valeurs["prenom"] = request.form["prenom"]
         valeurs["nom"] = request.form["nom"]
         valeurs["courriel"] = request.form["courriel"]
-        photo = None
-
-        db = get_db()
-        if "photo" in request.files and request.files["photo"].filename:
-            photo = request.files["photo"]
-            if is_png_image_valide(photo):
-                if utilisateur["pic_id"] is None:
-                    utilisateur["pic_id"] = str(uuid.uuid4().hex)
-                    db.create_picture(utilisateur["pic_id"], photo)
-                else:
-                    db.modify_picture(utilisateur["pic_id"], photo)
+        photo = photo_envoyee()
 
         erreurs = valider_user_modifier(
             valeurs["password"],
@@ -292,14 +675,26 @@ def modifier_utilisateur(identifiant):
             photo,
         )
         if len(erreurs) == 0:
-            db.modify_user(
+            pic_id = utilisateur["pic_id"]
+            picture = None
+            if photo is not None:
+                if pic_id is None:
+                    pic_id = str(uuid.uuid4().hex)
+                picture = get_pictures().prepare(photo.stream)
+            # False when the user was deleted since it was read above.
+            if not write(
+                get_writes(),
+                db,
+                "modify_user",
                 identifiant,
                 valeurs["password"],
                 valeurs["prenom"],
                 valeurs["nom"],
                 valeurs["courriel"],
-                utilisateur["pic_id"],
-            )
+                pic_id,
+                picture,
+            ).result(app.config["WRITE_BEHIND_TIMEOUT"]):
+                return render_template("404.html"), 404
             return redirect(url_for("utilisateurs"))
         else:
             return render_template(
@@ -314,12 +709,12 @@ def modifier_utilisateur(identifiant):
 @authentication_required
 def modifier_statut(identifiant):
     db = get_db()
-    utilisateur = db.get_user(identifiant)
-    if utilisateur is None:
-        return render_template("404.html"), 404
-    else:
-        db.modify_user_status(identifiant)
+    if write(
+        get_writes(), db, "modify_user_status", identifiant
+    ).result(app.config["WRITE_BEHIND_TIMEOUT"]):
         return redirect(url_for("utilisateurs"))
+    else:
+        return render_template("404.html"), 404
 
 
 @app.route("/logout")
@@ -327,7 +722,7 @@ def modifier_statut(identifiant):
 def logout():
     id_session = session["id"]
     session.pop("id", None)
-    get_db().delete_session(id_session)
+    get_sessions().delete(id_session)
     return redirect("/")
 
 
@@ -341,111 +736,16 @@ def method_not_allowed(error):
     return render_template("405.html"), 405
 
 
-def valider_recherche(recherche):
-    if len(recherche) < 3:
-        return "La recherche doit contenir au moins 3 caractères."
-
-
-def valider_article(titre, date_publication, contenu):
-    erreurs = {}
-
-    if not titre or len(titre) > 50:
-        erreurs["titre"] = "Le titre doit contenir entre 1 et 50 caractères."
-
-    if not is_valid_date(date_publication):
-        erreurs["date_publication"] = "Date de publication invalide."
-
-    if not contenu or len(contenu) > 500:
-        erreurs["contenu"] = "Le contenu doit contenir de 1 à 500 caractères."
-
-    return erreurs
-
-
-def valider_modification_article(titre, contenu):
-    erreurs = {}
-
-    if not titre or len(titre) > 50:
-        erreurs["titre"] = "Le titre doit contenir entre 1 et 50 caractères."
-
-    if not contenu or len(contenu) > 500:
-        erreurs["contenu"] = "Le contenu doit contenir de 1 à 500 caractères."
-
-    return erreurs
-
-
-def valider_user(username, password, prenom, nom, courriel, photo):
-    erreurs = {}
-    if valider_username(username) is not None:
-        erreurs["username"] = valider_username(username)
-
-    if not password or len(password) > 25 or len(password) < 3:
-        erreurs["password"] = "Le password doit contenir de 3 à 25 caractères."
-
-    if not nom or len(nom) > 20 or len(nom) < 3:
-        erreurs["nom"] = "Le nom doit contenir entre 3 et 20 caractères."
-
-    if not prenom or len(prenom) > 20 or len(prenom) < 3:
-        erreurs["prenom"] = "Le prenom doit contenir de 3 à 20 caractères."
-
-    if not is_png_image_valide(photo):
-        erreurs["photo"] = "La photo de profil doit être une image png valide."
-
-    if is_courriel_valide(courriel) is not None:
-        erreurs["courriel"] = is_courriel_valide(courriel)
-
-    return erreurs
-
-
-def valider_user_modifier(password, prenom, nom, courriel, photo):
-    erreurs = {}
-
-    if not password or len(password) > 25 or len(password) < 3:
-        erreurs["password"] = "Le password doit contenir de 3 à 25 caractères."
-
-    if not nom or len(nom) > 20 or len(nom) < 3:
-        erreurs["nom"] = "Le nom doit contenir entre 3 et 20 caractères."
-
-    if not prenom or len(prenom) > 20 or len(prenom) < 3:
-        erreurs["prenom"] = "Le prenom doit contenir de 3 à 20 caractères."
+@app.errorhandler(413)
+def request_entity_too_large(error):
+    return render_template("413.html"), 413
 
-    if not is_png_image_valide(photo):
-        erreurs["photo"] = "La photo de profil doit être une image png valide."
 
-    if is_courriel_valide(courriel) is not None:
-        erreurs["courriel"] = is_courriel_valide(courriel)
-
-    return erreurs
-
-
-def valider_username(username):
-    db = get_db()
-    if not username or len(username) > 25 or len(username) < 3:
-        return "Le username doit contenir entre 3 et 25 caractères."
-    elif db.is_username_taken(username):
-        return "Ce nom d'utilisateur existe déjà"
-
-
-def is_courriel_valide(courriel):
-    if not courriel or len(courriel) > 100:
-        return "Le courriel doit avoir moins de 100 caractères."
-    elif not re.match(r"[^@]+@[^@]+\.[^@]+", courriel):
-        return "Le courriel doit avoir le format exemple@hotmail.com."
-
-
-def is_png_image_valide(image):
-    if not image or image.read() == b"":
-        return True
-    else:
-        png_signature = b"\x89PNG\r\n\x1a\n"
-        image.seek(0)
-        file_signature = image.read(8)
-        return file_signature == png_signature
-
-
-def is_valid_date(date_str):
-    date_pattern = r"^\d{4}-\d{2}-\d{2}$"
-
-    if re.search(date_pattern, date_str):
-        return True
-    else:
-        return False
+def photo_envoyee():
+    # An empty file field means that no photo was sent.
+    photo = request.files.get("photo")
+    if photo is None or not photo.filename:
+        return None
+    if stream_size(photo.stream) == 0:
+        return None
+    return photo
@@ -0,0 +1,202 @@
+import csv
+import json
+import os
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .database import (
+    ARTICLE_EXPORT_COLUMNS,
+    USER_EXPORT_COLUMNS,
+    Database,
+    generate_salt,
+    hash_password,
+)
+from .validation import valider_article, valider_user
+
+FORMATS = ("jsonl", "csv")
+
+
+def guess_format(path, format_):
+    if format_:
+        return format_
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return extension if extension in FORMATS else "jsonl"
+
+
+def read_rows(fichier, format_):
+    if format_ == "csv":
+        for numero, row in enumerate(csv.DictReader(fichier), start=2):
+            yield numero, row
+    else:
+        for numero, line in enumerate(fichier, start=1):
+            if line.strip():
+                try:
+                    yield numero, json.loads(line)
+                except ValueError:
+                    yield numero, None
+
+
+def _text(row, key):
+    value = row.get(key)
+    return "" if value is None else str(value)
+
+
+def _optional_int(row, key):
+    value = row.get(key)
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def _actif(row):
+    value = row.get("actif")
+    if value is None or value == "":
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "vrai", "oui")
+    return bool(value)
+
+
+def article_row(db, row):
+    # Same rules as the /submit_article form. The author is either given
+    # by auteur_id, or by username as the form does, or kept as free text.
+    titre = _text(row, "titre")
+    date_publication = _text(row, "date_publication")
+    contenu = _text(row, "contenu")
+    erreurs = valider_article(titre, date_publication, contenu)
+    auteur_id = _optional_int(row, "auteur_id")
+    auteur = _text(row, "auteur")
+    if auteur_id is None and row.get("username"):
+        auteur_id, auteur = db.get_author(row["username"])
+        if auteur_id is None:
+            erreurs["username"] = "Utilisateur inconnu."
+    elif auteur_id is not None and db.get_user(auteur_id) is None:
+        erreurs["auteur_id"] = "Utilisateur inconnu."
+    if not auteur:
+        erreurs["auteur"] = "L'auteur est obligatoire."
+    identifiant = _text(row, "id") or titre.replace(" ", "-")
+    values = (
+        identifiant, titre, auteur, date_publication, contenu, auteur_id
+    )
+    return values, erreurs
+
+
+def user_row(db, row):
+    # Same rules as the user form. Rows coming from an export carry
+    # password_hash and salt instead of a password.
+    username = _text(row, "username")
+    password = row.get("password")
+    prenom = _text(row, "prenom")
+    nom = _text(row, "nom")
+    courriel = _text(row, "courriel")
+    erreurs = valider_user(username, password, prenom, nom, courriel, None)
+    if password:
+        salt = generate_salt()
+        password_hash = hash_password(password, salt)
+    else:
+        salt = _text(row, "salt")
+        password_hash = _text(row, "password_hash")
+        if salt and password_hash:
+            erreurs.pop("password", None)
+    # A photo that is not in this database would answer 404: drop it.
+    pic_id = row.get("pic_id") or None
+    if pic_id is not None and db.get_picture_info(pic_id) is None:
+        pic_id = None
+    values = (
+        _optional_int(row, "id"), username, password_hash, salt, prenom, nom,
+        courriel, _actif(row), pic_id,
+    )
+    return values, erreurs
+
+
+TABLES = {
+    "articles": (article_row, "add_articles", "iter_articles",
+                 ARTICLE_EXPORT_COLUMNS),
+    "utilisateurs": (user_row, "add_users", "iter_users",
+                     USER_EXPORT_COLUMNS),
+}
+
+
+archive_cli = AppGroup("archive", help="Import et export en bloc.")
+
+
+@archive_cli.command("import")
+@click.argument("table", type=click.Choice(list(TABLES)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "format_", type=click.Choice(FORMATS))
+@click.option("--taille-lot", default=10000, show_default=True,
+              help="Lignes par transaction.")
+def import_command(table, path, format_, taille_lot):
+    """Importe des articles ou des utilisateurs (JSONL ou CSV)."""
+    build_row, add_rows, _, _ = TABLES[table]
+    db = Database(current_app.config["DATABASE"])
+    inserted = ignored = invalid = 0
+    batch = []
+
+    def flush():
+        nonlocal inserted, ignored
+        count = getattr(db, add_rows)(batch)
+        inserted += count
+        ignored += len(batch) - count
+        batch.clear()
+
+    try:
+        with open(path, encoding="utf-8", newline="") as fichier:
+            for numero, row in read_rows(fichier, guess_format(path, format_)):
+                try:
+                    values, erreurs = build_row(db, row)
+                except (AttributeError, TypeError, ValueError):
+                    erreurs = {"ligne": "Ligne illisible."}
+                if erreurs:
+                    invalid += 1
+                    for champ, message in erreurs.items():
+                        click.echo(f"ligne {numero}: {champ}: {message}",
+                                   err=True)
+                    continue
+                batch.append(values)
+                if len(batch) >= taille_lot:
+                    flush()
+        if batch:
+            flush()
+    finally:
+        db.disconnect()
+    click.echo(
+        f"{inserted} ligne(s) importée(s), {ignored} déjà présente(s)."
+    )
+    if invalid:
+        raise click.ClickException(
+            f"{invalid} ligne(s) invalide(s) ignorée(s)."
+        )
+
+
+@archive_cli.command("export")
+@click.argument("table", type=click.Choice(list(TABLES)))
+@click.argument("path", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "format_", type=click.Choice(FORMATS))
+def export_command(table, path, format_):
+    """Exporte une table ligne par ligne (JSONL ou CSV, - pour stdout)."""
+    _, _, iter_rows, columns = TABLES[table]
+    format_ = guess_format(path, format_)
+    db = Database(current_app.config["DATABASE"])
+    if path == "-":
+        fichier = sys.stdout
+    else:
+        fichier = open(path, "w", encoding="utf-8", newline="")
+    try:
+        if format_ == "csv":
+            writer = csv.writer(fichier)
+            writer.writerow(columns)
+            writer.writerows(getattr(db, iter_rows)())
+        else:
+            for row in getattr(db, iter_rows)():
+                fichier.write(
+                    json.dumps(dict(zip(columns, row)), ensure_ascii=False)
+                    + "\n"
+                )
+    finally:
+        db.disconnect()
+        if fichier is not sys.stdout:
+            fichier.close()
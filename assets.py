@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+from werkzeug.exceptions import NotFound
+
+MANIFEST = "manifest.json"
+COMPRESSIBLE = (".css", ".js", ".svg", ".html", ".json", ".txt")
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def fingerprint(filename, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    base, extension = posixpath.splitext(filename)
+    return f"{base}.{digest}{extension}"
+
+
+def rewrite_css(filename, content, manifest):
+    # url() references are relative to the stylesheet; they are pointed at
+    # the fingerprinted files, which keep the same layout.
+    directory = posixpath.dirname(filename)
+
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r"^([a-z]+:|/|#)", url):
+            return match.group(0)
+        path = url.partition("?")[0]
+        target = posixpath.normpath(posixpath.join(directory, path))
+        if target not in manifest:
+            return match.group(0)
+        relative = posixpath.relpath(manifest[target], directory or ".")
+        return f"url({quote}{relative}{quote})"
+
+    text = content.decode("utf-8")
+    return CSS_URL.sub(replace, text).encode("utf-8")
+
+
+def _write_atomic(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _static_files(static_folder):
+    for directory, directories, files in os.walk(static_folder):
+        directories[:] = [name for name in directories if name[0] != "."]
+        for name in sorted(files):
+            if name[0] == ".":
+                continue
+            path = os.path.join(directory, name)
+            yield os.path.relpath(path, static_folder).replace(os.sep, "/")
+
+
+def build_assets(static_folder, output_folder):
+    # Stylesheets are built last so that they can reference the
+    # fingerprinted images; their own hash covers the rewritten content.
+    filenames = sorted(
+        _static_files(static_folder), key=lambda name: name.endswith(".css")
+    )
+    manifest = {}
+    for filename in filenames:
+        with open(os.path.join(static_folder, filename), "rb") as source:
+            content = source.read()
+        if filename.endswith(".css"):
+            content = rewrite_css(filename, content, manifest)
+        target = fingerprint(filename, content)
+        manifest[filename] = target
+        path = os.path.join(output_folder, target)
+        if os.path.exists(path):
+            continue
+        _write_atomic(path, content)
+        if filename.endswith(COMPRESSIBLE):
+            compressed = gzip.compress(content, 9, mtime=0)
+            if len(compressed) < len(content):
+                _write_atomic(path + ".gz", compressed)
+    _write_atomic(
+        os.path.join(output_folder, MANIFEST),
+        json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"),
+    )
+    return manifest
+
+
+def remove_stale_assets(output_folder, manifest):
+    current = set(manifest.values())
+    removed = 0
+    for filename in _static_files(output_folder):
+        original = filename[:-3] if filename.endswith(".gz") else filename
+        if filename != MANIFEST and original not in current:
+            os.unlink(os.path.join(output_folder, filename))
+            removed += 1
+    return removed
+
+
+class AssetManifest:
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self._manifest = None
+
+    def load(self):
+        if self._manifest is None:
+            try:
+                with open(
+                    os.path.join(self.output_folder, MANIFEST),
+                    encoding="utf-8",
+                ) as fichier:
+                    self._manifest = json.load(fichier)
+            except FileNotFoundError:
+                self._manifest = {}
+        return self._manifest
+
+    def url(self, filename):
+        # Without a build (or in debug mode) files come from static/.
+        if not current_app.debug:
+            target = self.load().get(filename)
+            if target is not None:
+                return url_for("assets", filename=target)
+        return url_for("static", filename=filename)
+
+
+def asset_response(output_folder, filename):
+    if filename == MANIFEST:
+        raise NotFound()
+    mimetype = mimetypes.guess_type(filename)[0]
+    accepts_gzip = "gzip" in request.accept_encodings
+    gzip_path = os.path.join(output_folder, filename + ".gz")
+    if accepts_gzip and os.path.exists(gzip_path):
+        response = send_from_directory(
+            output_folder,
+            filename + ".gz",
+            mimetype=mimetype,
+            max_age=IMMUTABLE_MAX_AGE,
+        )
+        response.content_encoding = "gzip"
+    else:
+        response = send_from_directory(
+            output_folder,
+            filename,
+            mimetype=mimetype,
+            max_age=IMMUTABLE_MAX_AGE,
+        )
+    if filename.endswith(COMPRESSIBLE):
+        response.vary.add("Accept-Encoding")
+    response.cache_control.immutable = True
+    return response
+
+
+assets_cli = AppGroup("assets", help="Fichiers statiques versionnés.")
+
+
+@assets_cli.command("build")
+@click.option("--nettoyer", is_flag=True,
+              help="Supprime les versions qui ne sont plus référencées.")
+def build_command(nettoyer):
+    """Versionne et compresse les fichiers de static/."""
+    output_folder = current_app.config["ASSETS_DIRECTORY"]
+    manifest = build_assets(current_app.static_folder, output_folder)
+    click.echo(f"{len(manifest)} fichier(s) dans {output_folder}.")
+    if nettoyer:
+        removed = remove_stale_assets(output_folder, manifest)
+        click.echo(f"{removed} ancien(s) fichier(s) supprimé(s).")
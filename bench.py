@@ -0,0 +1,448 @@
+import http.cookiejar
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .changes import ChangeFeed
+from .database import generate_salt, get_pool, hash_password
+from .migrations import upgrade
+from .rendering import RENDERER_VERSION, render_contenu
+from .suggest import TitleIndex
+
+# Every seeded user shares this password (hashed once) so that /login and
+# the authenticated routes can be driven with any of them.
+BENCH_PASSWORD = "motdepasse"
+BATCH_SIZE = 10000
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+MOTS = (
+    "univers galaxie planète étoile comète océan montagne forêt rivière "
+    "désert ville musique peinture histoire science cuisine voyage jardin "
+    "lumière ombre saison hiver printemps été automne mémoire avenir "
+    "robot machine réseau donnée algorithme langage poème roman théâtre"
+).split()
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(connection, query, rows):
+    total = 0
+    for batch in _batches(rows):
+        connection.executemany(query, batch)
+        connection.commit()
+        total += len(batch)
+    return total
+
+
+def _phrase(rng, nb_mots):
+    return " ".join(rng.choice(MOTS) for _ in range(nb_mots))
+
+
+def seed_database(
+    path, articles, users, sessions, photos, taille_photo, graine=0
+):
+    upgrade(path)
+    rng = random.Random(graine)
+    salt = generate_salt()
+    password_hash = hash_password(BENCH_PASSWORD, salt)
+    pic_ids = [uuid.UUID(int=n + 1).hex for n in range(min(photos, users))]
+    today = date.today()
+    now = time.time()
+
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        counts = {}
+        counts["photos"] = _insert(
+            connection,
+            "INSERT INTO ProfilPhotos(pic_id, photo_profil, sha256, "
+            "date_modification, taille) "
+            "VALUES(?, ?, lower(hex(randomblob(32))), ?, ?)",
+            (
+                (pic_id, PNG_SIGNATURE + rng.randbytes(taille_photo), now,
+                 len(PNG_SIGNATURE) + taille_photo)
+                for pic_id in pic_ids
+            ),
+        )
+        counts["utilisateurs"] = _insert(
+            connection,
+            "INSERT INTO Utilisateurs(id, username, password_hash, salt, "
+            "prenom, nom, courriel, pic_id) VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (n + 1, f"user{n}", password_hash, salt, f"Prenom{n}",
+                 f"Nom{n}", f"user{n}@example.com",
+                 pic_ids[n] if n < len(pic_ids) else None)
+                for n in range(users)
+            ),
+        )
+        counts["articles"] = _insert(
+            connection,
+            "INSERT INTO Articles(id, titre, auteur, date_publication, "
+            "contenu, auteur_id, contenu_html, rendu_version) "
+            "VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                _article(rng, n, users, today)
+                for n in range(articles)
+            ),
+        )
+        counts["sessions"] = _insert(
+            connection,
+            "INSERT INTO sessions(id_session, utilisateur, date_creation, "
+            "derniere_activite) VALUES(?, ?, ?, ?)",
+            (
+                (uuid.UUID(int=rng.getrandbits(128)).hex,
+                 f"user{rng.randrange(max(users, 1))}", now, now)
+                for _ in range(sessions)
+            ),
+        )
+        connection.execute("ANALYZE")
+        connection.commit()
+    finally:
+        connection.close()
+    return counts
+
+
+def _article(rng, n, users, today):
+    titre = f"{_phrase(rng, 3)} {n}"[:50]
+    auteur_id = None
+    auteur = "Anonyme"
+    if users:
+        n_auteur = rng.randrange(users)
+        auteur_id = n_auteur + 1
+        auteur = f"Prenom{n_auteur} Nom{n_auteur}"
+    date_publication = today - timedelta(days=rng.randrange(3650))
+    contenu = _phrase(rng, rng.randrange(20, 70))[:500]
+    return (
+        titre.replace(" ", "-"),
+        titre,
+        auteur,
+        date_publication.isoformat(),
+        contenu,
+        auteur_id,
+        render_contenu(contenu),
+        RENDERER_VERSION,
+    )
+
+
+def _sample(connection, query, limit=1000):
+    return [row[0] for row in connection.execute(query, (limit,))]
+
+
+class Workload:
+    # Request generators for every route of app.py, fed with ids sampled
+    # from the benchmark database.
+    def __init__(self, path, graine=0):
+        connection = sqlite3.connect(path)
+        try:
+            self.article_ids = _sample(
+                connection, "SELECT id FROM Articles ORDER BY random() LIMIT ?"
+            )
+            self.pic_ids = _sample(
+                connection,
+                "SELECT pic_id FROM ProfilPhotos ORDER BY random() LIMIT ?",
+            )
+            self.usernames = _sample(
+                connection,
+                "SELECT username FROM Utilisateurs ORDER BY random() LIMIT ?",
+            )
+            self.volumes = {
+                table: connection.execute(
+                    f"SELECT COUNT(*) FROM {table}"
+                ).fetchone()[0]
+                for table in ("Articles", "Utilisateurs", "sessions")
+            }
+        finally:
+            connection.close()
+        self.rng = random.Random(graine)
+        self._lock = threading.Lock()
+
+    def _choice(self, values, default):
+        with self._lock:
+            return self.rng.choice(values) if values else default
+
+    def routes(self):
+        # (nom, méthode, authentification requise, fonction -> (url, data))
+        return [
+            ("/", "GET", False, lambda: ("/", None)),
+            ("/recherche", "GET", False, self.recherche),
+            ("/recherche/suggest", "GET", False, self.suggest),
+            ("/article/<id>", "GET", False, self.article),
+            ("/admin", "GET", True, lambda: ("/admin", None)),
+            ("/image/<pic_id>.png", "GET", False, self.image),
+            ("/login", "POST", False, self.login),
+            ("/submit_article", "POST", True, self.submit_article),
+        ]
+
+    def recherche(self):
+        query = urllib.parse.urlencode({"recherche": self._choice(MOTS, "")})
+        return f"/recherche?{query}", None
+
+    def suggest(self):
+        mot = self._choice(MOTS, "")
+        query = urllib.parse.urlencode({"q": mot[:3]})
+        return f"/recherche/suggest?{query}", None
+
+    def article(self):
+        article_id = self._choice(self.article_ids, "inexistant")
+        return f"/article/{urllib.parse.quote(article_id)}", None
+
+    def image(self):
+        return f"/image/{self._choice(self.pic_ids, 'inexistant')}.png", None
+
+    def login(self):
+        return "/login", {
+            "username": self._choice(self.usernames, "inexistant"),
+            "password": BENCH_PASSWORD,
+        }
+
+    def submit_article(self):
+        with self._lock:
+            contenu = _phrase(self.rng, 40)[:500]
+        return "/submit_article", {
+            "titre": f"Bench {uuid.uuid4().hex[:12]}",
+            "date_publication": date.today().isoformat(),
+            "contenu": contenu,
+        }
+
+
+def percentile(durations, p):
+    if not durations:
+        return None
+    rank = max(int(round(p / 100 * len(durations))) - 1, 0)
+    return durations[min(rank, len(durations) - 1)]
+
+
+def summarize(durations, erreurs, elapsed):
+    durations = sorted(durations)
+    return {
+        "requetes": len(durations),
+        "erreurs": erreurs,
+        "p50_ms": percentile(durations, 50),
+        "p95_ms": percentile(durations, 95),
+        "p99_ms": percentile(durations, 99),
+        "moyenne_ms": sum(durations) / len(durations) if durations else None,
+        "debit_rps": len(durations) / elapsed if elapsed else None,
+    }
+
+
+def run_client(app, workload, requetes):
+    # In-process: measures the application and the database, no network.
+    client = app.test_client()
+    username = workload.usernames[0] if workload.usernames else ""
+    client.post(
+        "/login", data={"username": username, "password": BENCH_PASSWORD}
+    )
+    results = {}
+    for nom, method, _, make_request in workload.routes():
+        durations = []
+        erreurs = 0
+        started = time.perf_counter()
+        for _ in range(requetes):
+            url, data = make_request()
+            begin = time.perf_counter()
+            response = client.open(url, method=method, data=data)
+            response.get_data()
+            durations.append((time.perf_counter() - begin) * 1000)
+            erreurs += response.status_code >= 400
+            response.close()
+        results[nom] = summarize(
+            durations, erreurs, time.perf_counter() - started
+        )
+    return results
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_http(base_url, workload, requetes, concurrence):
+    # Each worker thread keeps its own cookie jar, logged in on first use.
+    local = threading.local()
+
+    def opener():
+        if getattr(local, "opener", None) is None:
+            local.opener = urllib.request.build_opener(
+                urllib.request.HTTPCookieProcessor(
+                    http.cookiejar.CookieJar()
+                ),
+                _NoRedirect,
+            )
+            local.authenticated = False
+        return local.opener
+
+    def send(method, url, data):
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(
+            base_url.rstrip("/") + url, data=body, method=method
+        )
+        try:
+            with opener().open(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+    def one(method, needs_auth, make_request):
+        if needs_auth and not getattr(local, "authenticated", False):
+            send("POST", *workload.login())
+            local.authenticated = True
+        url, data = make_request()
+        begin = time.perf_counter()
+        try:
+            status = send(method, url, data)
+        except OSError:
+            status = None
+        duration = (time.perf_counter() - begin) * 1000
+        return duration, status is None or status >= 400
+
+    results = {}
+    with ThreadPoolExecutor(concurrence) as executor:
+        for nom, method, needs_auth, make_request in workload.routes():
+            started = time.perf_counter()
+            outcomes = list(
+                executor.map(
+                    lambda _: one(method, needs_auth, make_request),
+                    range(requetes),
+                )
+            )
+            results[nom] = summarize(
+                [duration for duration, _ in outcomes],
+                sum(erreur for _, erreur in outcomes),
+                time.perf_counter() - started,
+            )
+    return results
+
+
+bench_cli = AppGroup("bench", help="Mesures de performance par route.")
+
+
+@bench_cli.command("seed")
+@click.argument("path", type=click.Path(dir_okay=False))
+@click.option("--articles", default=1000000, show_default=True)
+@click.option("--utilisateurs", default=100000, show_default=True)
+@click.option("--sessions", default=1000000, show_default=True)
+@click.option("--photos", default=10000, show_default=True)
+@click.option("--taille-photo", default=20 * 1024, show_default=True)
+@click.option("--graine", default=0, help="Graine du générateur.")
+@click.option("--remplacer", is_flag=True, help="Écrase PATH s'il existe.")
+def seed_command(
+    path, articles, utilisateurs, sessions, photos, taille_photo, graine,
+    remplacer
+):
+    """Crée une base de test PATH remplie de données synthétiques."""
+    if os.path.exists(path):
+        if not remplacer:
+            raise click.ClickException(f"{path} existe déjà (--remplacer).")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+    started = time.perf_counter()
+    counts = seed_database(
+        path, articles, utilisateurs, sessions, photos, taille_photo, graine
+    )
+    for table, count in counts.items():
+        click.echo(f"{count} {table}")
+    click.echo(f"Base créée en {time.perf_counter() - started:.1f} s.")
+
+
+def _bind_database(app, path):
+    # The app was set up at import for DATABASE_PATH: what it bound to
+    # that database then is bound to the benchmark database instead.
+    slow_log = get_pool(app.config["DATABASE"]).slow_log
+    app.config["DATABASE"] = path
+    get_pool(path).slow_log = slow_log
+    app.extensions["changes"] = ChangeFeed()
+    app.extensions["suggest"] = TitleIndex(path)
+
+
+@bench_cli.command("run")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--requetes", default=200, show_default=True,
+              help="Requêtes par route.")
+@click.option("--url", help="Serveur à charger en HTTP (sinon test client).")
+@click.option("--concurrence", default=8, show_default=True,
+              help="Requêtes simultanées en mode HTTP.")
+@click.option("--sans-cache", is_flag=True,
+              help="Désactive le cache des pages (test client).")
+@click.option("--sortie", type=click.Path(dir_okay=False),
+              help="Fichier JSON des résultats.")
+@click.option("--graine", default=0, help="Graine du générateur.")
+def run_command(path, requetes, url, concurrence, sans_cache, sortie, graine):
+    """Mesure la latence de chaque route sur la base PATH."""
+    workload = Workload(path, graine)
+    if url:
+        # The server must itself be started with DATABASE_PATH=PATH.
+        mode = "http"
+        results = run_http(url, workload, requetes, concurrence)
+    else:
+        mode = "client"
+        app = current_app._get_current_object()
+        _bind_database(app, os.path.abspath(path))
+        if sans_cache:
+            app.extensions.pop("page_cache", None)
+        # Every test client request comes from the same address.
+        app.extensions.pop("rate_limits", None)
+        results = run_client(app, workload, requetes)
+
+    rapport = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mode": mode,
+        "concurrence": concurrence if url else 1,
+        "base": os.path.abspath(path),
+        "volumes": workload.volumes,
+        "routes": results,
+    }
+    for nom, result in results.items():
+        click.echo(
+            f"{nom:22} p50 {result['p50_ms'] or 0:8.2f} ms  "
+            f"p95 {result['p95_ms'] or 0:8.2f} ms  "
+            f"p99 {result['p99_ms'] or 0:8.2f} ms  "
+            f"{result['debit_rps'] or 0:8.1f} req/s  "
+            f"{result['erreurs']} erreur(s)"
+        )
+    if sortie:
+        with open(sortie, "w", encoding="utf-8") as fichier:
+            json.dump(rapport, fichier, indent=2, ensure_ascii=False)
+
+
+@bench_cli.command("compare")
+@click.argument("avant", type=click.File(encoding="utf-8"))
+@click.argument("apres", type=click.File(encoding="utf-8"))
+def compare_command(avant, apres):
+    """Compare deux fichiers de résultats (p50, p95, p99)."""
+    avant = json.load(avant)["routes"]
+    apres = json.load(apres)["routes"]
+    for nom in [nom for nom in avant if nom in apres]:
+        ligne = [f"{nom:22}"]
+        for mesure in ("p50_ms", "p95_ms", "p99_ms"):
+            old, new = avant[nom][mesure], apres[nom][mesure]
+            if old and new:
+                ligne.append(f"{mesure[:3]} {(new - old) / old:+7.1%}")
+        click.echo("  ".join(ligne))
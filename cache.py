@@ -0,0 +1,183 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+from flask import Response, current_app, g, request
+
+from . import changes
+from .compression import compress_body
+
+
+class PageCache:
+    # Rendered pages bounded by total body size, evicted LRU. Every entry
+    # carries tags; a write invalidates exactly the entries tagged with
+    # what it changed. Pages may depend on date.today() (scheduled
+    # articles), so everything is dropped when the date rolls over.
+    # Compressed copies of a page are kept in its entry, by encoding.
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidation so that a page rendered from data
+        # read before a write is not stored after that write.
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._today = date.today()
+        self._lock = threading.Lock()
+        changes.article_changed.connect(self.on_article_changed)
+        changes.user_changed.connect(self.on_user_changed)
+        changes.articles_rendered.connect(self.on_articles_rendered)
+        changes.changes_lost.connect(self.on_changes_lost)
+
+    def _clear(self):
+        self._entries.clear()
+        self._tags.clear()
+        self.size = 0
+
+    def _check_date(self):
+        today = date.today()
+        if today != self._today:
+            self._clear()
+            self._today = today
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._clear()
+
+    def _remove(self, key):
+        body, status, tags, variants = self._entries.pop(key)
+        self.size -= len(body) + sum(map(len, variants.values()))
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            self._check_date()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1], entry[3]
+
+    def put(self, key, body, status, tags, generation):
+        if len(body) > self.max_size:
+            return
+        with self._lock:
+            self._check_date()
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, status, tags, {})
+            self.size += len(body)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._evict()
+
+    def put_variant(self, key, body, encoding, data):
+        with self._lock:
+            entry = self._entries.get(key)
+            # The page may have been replaced since it was read.
+            if entry is None or entry[0] is not body:
+                return
+            if encoding not in entry[3]:
+                entry[3][encoding] = data
+                self.size += len(data)
+                self._evict()
+
+    def _evict(self):
+        while self.size > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tag):
+        with self._lock:
+            self.generation += 1
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def on_article_changed(self, article_id):
+        self.invalidate("articles")
+        self.invalidate(f"article:{article_id}")
+
+    def on_user_changed(self, user_id):
+        self.invalidate(f"utilisateur:{user_id}")
+
+    def on_articles_rendered(self, version):
+        # A re-render touches every article page and listing.
+        self.clear()
+
+    def on_changes_lost(self, feed):
+        self.clear()
+
+
+def add_cache_tags(*tags):
+    # Tags only known once the view has read its data (e.g. the author).
+    g.setdefault("cache_tags", set()).update(tags)
+
+
+def cached_response(cache, key, body, status, variants):
+    # Served compressed from the cache: compress_response() leaves a
+    # response that already has a Content-Encoding alone.
+    config = current_app.config
+    response = Response(body, status, mimetype="text/html")
+    response.vary.add("Accept-Encoding")
+    if len(body) < config["COMPRESSION_MIN_SIZE"]:
+        return response
+    encoding = request.accept_encodings.best_match(
+        config["COMPRESSION_ENCODINGS"]
+    )
+    if encoding is None:
+        return response
+    data = variants.get(encoding)
+    if data is None:
+        data = compress_body(body, encoding, config["COMPRESSION_LEVEL"])
+        cache.put_variant(key, body, encoding, data)
+    response.set_data(data)
+    response.content_encoding = encoding
+    return response
+
+
+def cached_page(*tags):
+    # Tags may reference view arguments, e.g. "article:{identifiant}".
+    def decorator(view):
+        @wraps(view)
+        def decorated(**kwargs):
+            cache = current_app.extensions.get("page_cache")
+            if cache is None or request.method != "GET":
+                return view(**kwargs)
+            key = (request.endpoint, tuple(sorted(kwargs.items())))
+            entry = cache.get(key)
+            if entry is not None:
+                return cached_response(cache, key, *entry)
+            generation = cache.generation
+            rv = view(**kwargs)
+            status = 200
+            body = rv
+            if isinstance(rv, tuple):
+                body, status = rv
+            if status == 200 and isinstance(body, str):
+                body = body.encode()
+                cache.put(
+                    key,
+                    body,
+                    status,
+                    {tag.format(**kwargs) for tag in tags}
+                    | g.pop("cache_tags", set()),
+                    generation,
+                )
+                return cached_response(cache, key, body, status, {})
+            return rv
+
+        return decorated
+
+    return decorator
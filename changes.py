@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+
+from blinker import Namespace
+
+# Database publishes a signal after committing a write, with the changed
+# row key as sender. Every write is also appended to change_log in the
+# same transaction so that other worker processes can replay it.
+_signals = Namespace()
+article_changed = _signals.signal("article-changed")
+user_changed = _signals.signal("user-changed")
+# Only the rendered HTML changed, for a whole batch of articles; the
+# sender is the renderer version.
+articles_rendered = _signals.signal("articles-rendered")
+session_deleted = _signals.signal("session-deleted")
+
+SIGNALS = {
+    "article": article_changed,
+    "utilisateur": user_changed,
+    "rendu": articles_rendered,
+    "session": session_deleted,
+}
+# Sent instead of the changes themselves when a worker is too far behind
+# to replay them: whatever was derived from the database is dropped.
+changes_lost = _signals.signal("changes-lost")
+
+
+def publish(sujet, cle):
+    SIGNALS[sujet].send(cle)
+
+
+class ChangeFeed:
+    def __init__(self, interval=1.0, retention=60 * 60, max_replay=1000):
+        self.interval = interval
+        self.retention = retention
+        self.max_replay = max_replay
+        self.pid = os.getpid()
+        self.last_id = None
+        self.next_poll = 0
+        self.next_prune = 0
+        self._lock = threading.Lock()
+
+    def poll(self, db, seen=None):
+        # `seen` is the last change the client is known to have made: it
+        # must not be served a page older than that, so the feed catches
+        # up now instead of at the next interval.
+        now = time.monotonic()
+        if (
+            seen is not None
+            and self.last_id is not None
+            and seen > self.last_id
+        ):
+            with self._lock:
+                if seen > self.last_id:
+                    self.next_poll = now + self.interval
+                    self._poll(db, now)
+            return
+        if now < self.next_poll or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self.next_poll = now + self.interval
+            self._poll(db, now)
+        finally:
+            self._lock.release()
+
+    def _poll(self, db, now):
+        # Forked workers inherit the feed; their own writes use their pid.
+        self.pid = os.getpid()
+        if self.last_id is None:
+            self.last_id = db.get_last_change_id()
+            return
+        rows = db.get_changes_since(self.last_id, self.max_replay + 1)
+        if len(rows) > self.max_replay:
+            # Replaying would hold up this request; starting over is
+            # cheaper past that many changes.
+            self.last_id = db.get_last_change_id()
+            changes_lost.send(self)
+        elif rows:
+            self.last_id = rows[-1][0]
+            # A key changed several times is only replayed once.
+            pending = dict.fromkeys(
+                (sujet, cle) for _, sujet, cle, pid in rows if pid != self.pid
+            )
+            for sujet, cle in pending:
+                publish(sujet, cle)
+        if now >= self.next_prune:
+            self.next_prune = now + self.retention / 4
+            db.delete_changes_before(time.time() - self.retention)
@@ -0,0 +1,75 @@
+import zlib
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+    "text/css",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+    "text/xml",
+}
+
+# zlib window bits for each Content-Encoding.
+WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def compress_chunks(chunks, encoding, level):
+    # Each chunk is flushed as soon as it is compressed so that a streamed
+    # response keeps reaching the client while it is being produced.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk)
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def compress_body(data, encoding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_response(response, request, min_size, level, encodings):
+    if (
+        request.method == "HEAD"
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or "Content-Encoding" in response.headers
+        # Files sent by send_file(); static/ has its own gzip copies.
+        or response.direct_passthrough
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_chunks(
+            response.response, encoding, level
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(compress_body(data, encoding, level))
+    response.content_encoding = encoding
+    # The compressed body is another representation of the same resource;
+    # a weak ETag still matches If-None-Match (weak comparison).
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
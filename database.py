@@ -1,33 +1,154 @@
 import sqlite3
 from datetime import date
+import base64
 import hashlib
+import json
+import os
+import re
 import secrets
+import threading
+import time
+
+from markupsafe import Markup
+
+from . import changes, metrics
+from .rendering import RENDERER_VERSION, render_contenu
+from .slowlog import TracedConnection
+
+
+DATABASE_PATH = os.environ.get(
+    "DATABASE_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "db", "database.db"
+    ),
+)
+
+# WAL lets readers proceed while a writer holds the lock; NORMAL is durable
+# across application crashes in WAL mode and only skips the fsync per commit.
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", 5000),
+    ("cache_size", -16000),
+    ("mmap_size", 268435456),
+    ("temp_store", "MEMORY"),
+)
+
+BLOB_CHUNK_SIZE = 64 * 1024
+
+
+USER_COLUMNS = "id, username, nom, prenom, courriel, actif, pic_id"
+ARTICLE_EXPORT_COLUMNS = (
+    "id", "titre", "auteur", "date_publication", "contenu", "auteur_id"
+)
+USER_EXPORT_COLUMNS = (
+    "id", "username", "password_hash", "salt", "prenom", "nom", "courriel",
+    "actif", "pic_id",
+)
+
+_NOT_LOADED = object()
+
+
+class Record:
+    # Rows are built by record_factory() straight from the cursor. Item
+    # access is kept so that views can keep using record["champ"].
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.id!r}>"
+
+
+class Article(Record):
+    # Queries whose pages show an article's content select contenu (and
+    # contenu_html) with it. Listings skip it, and reading it there raises
+    # rather than running one query per article. contenu_html is rendered
+    # at write time; older articles are rendered on read until `flask
+    # articles rendre`.
+    __slots__ = (
+        "id",
+        "titre",
+        "auteur",
+        "date_publication",
+        "auteur_id",
+        "pic_id",
+        "extrait",
+        "_contenu",
+        "_contenu_html",
+    )
 
+    def __init__(self):
+        self.id = None
+        self.titre = None
+        self.auteur = None
+        self.date_publication = None
+        self.auteur_id = None
+        self.pic_id = None
+        self.extrait = None
+        self._contenu = _NOT_LOADED
+        self._contenu_html = None
+
+    @property
+    def contenu(self):
+        if self._contenu is _NOT_LOADED:
+            raise RuntimeError(
+                f"contenu of article {self.id!r} was not selected"
+            )
+        return self._contenu
+
+    @contenu.setter
+    def contenu(self, value):
+        self._contenu = value
+
+    @property
+    def contenu_html(self):
+        if self._contenu_html is None:
+            self._contenu_html = render_contenu(self.contenu)
+        return Markup(self._contenu_html)
+
+    @contenu_html.setter
+    def contenu_html(self, value):
+        self._contenu_html = value
+
+
+class Utilisateur(Record):
+    # password_hash and salt are never loaded into a record.
+    __slots__ = (
+        "id",
+        "username",
+        "nom",
+        "prenom",
+        "courriel",
+        "actif",
+        "pic_id",
+    )
+
+    def __init__(self):
+        self.id = None
+        self.username = None
+        self.nom = None
+        self.prenom = None
+        self.courriel = None
+        self.actif = None
+        self.pic_id = None
 
-def _build_article(data):
-    article = {
-        "id": data[0],
-        "titre": data[1],
-        "auteur": data[2],
-        "date_publication": data[3],
-        "contenu": data[4],
-    }
-    return article
-
-
-def _build_user(data):
-    user = {
-        "id": data[0],
-        "username": data[1],
-        "password_hash": data[2],
-        "salt": data[3],
-        "nom": data[4],
-        "prenom": data[5],
-        "courriel": data[6],
-        "actif": data[7],
-        "pic_id": data[8],
-    }
-    return user
+
+def record_factory(record_type):
+    def factory(cursor, row):
+        record = record_type()
+        for column, value in zip(cursor.description, row):
+            setattr(record, column[0], value)
+        return record
+
+    return factory
 
 
 def hash_password(password, salt):
@@ -40,34 +161,194 @@ def generate_salt(length=16):
     return salt_bytes.hex()
 
 
+def encode_cursor(date_publication, article_id):
+    data = json.dumps([date_publication, article_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def decode_cursor(curseur):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(curseur.encode("ascii")))
+    except ValueError:
+        return None
+    if (
+        not isinstance(data, list)
+        or len(data) != 2
+        or not all(isinstance(value, str) for value in data)
+    ):
+        return None
+    return data
+
+
+def article_conditions(
+    table, auteur=None, auteur_id=None, date_debut=None, date_fin=None
+):
+    conditions = []
+    params = []
+    if auteur:
+        conditions.append(f"{table}.auteur = ?")
+        params.append(auteur)
+    if auteur_id is not None:
+        conditions.append(f"{table}.auteur_id = ?")
+        params.append(auteur_id)
+    if date_debut:
+        conditions.append(f"{table}.date_publication >= ?")
+        params.append(date_debut)
+    if date_fin:
+        conditions.append(f"{table}.date_publication <= ?")
+        params.append(date_fin)
+    return conditions, params
+
+
+def fts_query(search_query):
+    # Every word becomes a quoted prefix term so that user input can never
+    # be interpreted as FTS5 query syntax.
+    words = re.findall(r"\w+", search_query)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class ConnectionPool:
+    def __init__(self, path, pragmas=PRAGMAS, max_idle=8):
+        self.path = path
+        self.pragmas = pragmas
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = os.getpid()
+        # SlowQueryLog; only connections opened after it is set are timed.
+        self.slow_log = None
+
+    def _open(self):
+        metrics.METRICS.inc("db_connections_opened_total")
+        factory = sqlite3.Connection
+        if self.slow_log is not None:
+            factory = TracedConnection
+        connection = sqlite3.connect(
+            self.path, timeout=5, check_same_thread=False, factory=factory
+        )
+        if self.slow_log is not None:
+            connection.slow_log = self.slow_log
+        for name, value in self.pragmas:
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    def acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Connections inherited across fork() must never be used
+                # (nor closed) by the child.
+                self._idle = []
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def idle_count(self):
+        return len(self._idle)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None):
+    path = os.path.abspath(path or DATABASE_PATH)
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+
+@metrics.instrument("get_connection", "disconnect")
 class Database:
-    def __init__(self):
+    def __init__(self, path=None):
+        self.pool = get_pool(path)
         self.connection = None
+        # Set by WriteQueue: changes of the current group, which commits
+        # and publishes them itself.
+        self.pending_changes = None
 
     def get_connection(self):
         if self.connection is None:
-            self.connection = sqlite3.connect("db/database.db")
+            self.connection = self.pool.acquire()
         return self.connection
 
     def disconnect(self):
         if self.connection is not None:
-            self.connection.close()
+            self.pool.release(self.connection)
+            self.connection = None
+
+    def _commit(self, connection):
+        if self.pending_changes is None:
+            connection.commit()
+
+    def _commit_changes(self, connection, *modifications):
+        for sujet, cle in modifications:
+            connection.execute(
+                "INSERT INTO change_log(sujet, cle, pid, date_creation) "
+                "VALUES(?, ?, ?, ?)",
+                (sujet, str(cle), os.getpid(), time.time()),
+            )
+        if self.pending_changes is not None:
+            self.pending_changes.extend(modifications)
+            return
+        connection.commit()
+        for sujet, cle in modifications:
+            changes.publish(sujet, str(cle))
 
-    def get_articles(self):
+    def get_last_change_id(self):
         cursor = self.get_connection().cursor()
-        query = (
-            "SELECT id, titre, identifiant, auteur, "
-            "date_publication, contenu "
-            "FROM Articles"
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+        last_id = cursor.fetchone()[0]
+        cursor.close()
+        return last_id
+
+    def get_changes_since(self, change_id, limit):
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "SELECT id, sujet, cle, pid FROM change_log WHERE id > ? "
+            "ORDER BY id LIMIT ?",
+            (change_id, limit),
         )
-        cursor.execute(query)
-        all_data = cursor.fetchall()
-        articles = [_build_article(item) for item in all_data]
+        modifications = cursor.fetchall()
         cursor.close()
-        return articles
+        return modifications
 
-    def get_article(self, article_id):
+    def delete_changes_before(self, timestamp):
+        connection = self.get_connection()
+        connection.execute(
+            "DELETE FROM change_log WHERE date_creation < ?", (timestamp,)
+        )
+        self._commit(connection)
+
+    def _article_cursor(self):
         cursor = self.get_connection().cursor()
+        cursor.row_factory = record_factory(Article)
+        return cursor
+
+    def _user_cursor(self):
+        cursor = self.get_connection().cursor()
+        cursor.row_factory = record_factory(Utilisateur)
+        return cursor
+
+    def get_article(self, article_id):
+        cursor = self._article_cursor()
         query = (
             "SELECT id, titre, auteur, date_publication, contenu "
             "FROM Articles WHERE id = ?"
@@ -75,186 +356,451 @@ class Database:
         cursor.execute(query, (article_id,))
         article = cursor.fetchone()
         cursor.close()
-        if article is None:
-            return None
-        else:
-            return _build_article(article)
+        return article
 
-    def get_articles_ordered_by_date(self):
-        connection = self.get_connection()
-        cursor = connection.cursor()
+    def get_article_title(self, article_id):
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "SELECT rowid, id, titre, date_publication FROM Articles "
+            "WHERE id = ?",
+            (article_id,),
+        )
+        data = cursor.fetchone()
+        cursor.close()
+        return data
+
+    def get_article_titles(self, after_rowid=0):
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "SELECT rowid, id, titre, date_publication FROM Articles "
+            "WHERE rowid > ? ORDER BY rowid",
+            (after_rowid,),
+        )
+        titles = cursor.fetchall()
+        cursor.close()
+        return titles
 
+    def get_article_with_author(self, article_id):
+        # The author's picture comes from Utilisateurs in the same lookup.
+        # The name is Articles.auteur, as in the listings: modify_user()
+        # keeps it in step with the account.
+        cursor = self._article_cursor()
         query = (
-            "SELECT id, titre, auteur, date_publication, contenu "
+            "SELECT a.id, a.titre, a.auteur, a.date_publication, "
+            "a.contenu, a.contenu_html, a.auteur_id, u.pic_id "
+            "FROM Articles a LEFT JOIN Utilisateurs u ON u.id = a.auteur_id "
+            "WHERE a.id = ?"
+        )
+        cursor.execute(query, (article_id,))
+        article = cursor.fetchone()
+        cursor.close()
+        return article
+
+    def get_articles_page(
+        self,
+        limit,
+        apres=None,
+        avant=None,
+        auteur=None,
+        date_debut=None,
+        date_fin=None,
+    ):
+        # Keyset pagination on (date_publication, id), newest first.
+        # `apres`/`avant` are decoded cursors; returns the page and the
+        # cursors of the previous and next pages (None at either end).
+        conditions, params = article_conditions(
+            "Articles", auteur, None, date_debut, date_fin
+        )
+        if avant is not None:
+            conditions.append("(date_publication, id) > (?, ?)")
+            params.extend(avant)
+            order = "ASC"
+        else:
+            if apres is not None:
+                conditions.append("(date_publication, id) < (?, ?)")
+                params.extend(apres)
+            order = "DESC"
+        where = ""
+        if conditions:
+            where = "WHERE " + " AND ".join(conditions) + " "
+
+        cursor = self._article_cursor()
+        cursor.execute(
+            "SELECT id, titre, auteur, date_publication "
             "FROM Articles "
-            "ORDER BY date_publication DESC"
+            + where
+            + f"ORDER BY date_publication {order}, id {order} "
+            "LIMIT ?",
+            (*params, limit + 1),
         )
-        cursor.execute(query)
-        articles_data = cursor.fetchall()
-
+        articles = cursor.fetchall()
         cursor.close()
 
-        articles = [
-            _build_article(article_data)
-            for article_data in articles_data
-        ]
+        has_more = len(articles) > limit
+        articles = articles[:limit]
+        if avant is not None:
+            articles.reverse()
+        if not articles:
+            return articles, None, None
+
+        first = articles[0]
+        last = articles[-1]
+        precedent = encode_cursor(first.date_publication, first.id)
+        suivant = encode_cursor(last.date_publication, last.id)
+        if avant is not None:
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = apres is not None, has_more
+        return (
+            articles,
+            precedent if has_previous else None,
+            suivant if has_next else None,
+        )
 
-        return articles
+    def iter_published_articles(self, limit, apres=None, **filtres):
+        # Same keyset order as get_articles_page, restricted to published
+        # articles and with contenu. Rows are yielded as SQLite steps, so
+        # a caller can stream them; limit + 1 rows tell it whether there
+        # is a next page.
+        conditions, params = article_conditions("a", **filtres)
+        conditions.insert(0, "a.date_publication <= ?")
+        params.insert(0, date.today())
+        if apres is not None:
+            conditions.append("(a.date_publication, a.id) < (?, ?)")
+            params.extend(apres)
+        cursor = self._article_cursor()
+        try:
+            cursor.execute(
+                "SELECT a.id, a.titre, a.auteur, a.date_publication, "
+                "a.contenu, a.auteur_id "
+                "FROM Articles a "
+                "WHERE " + " AND ".join(conditions) + " "
+                "ORDER BY a.date_publication DESC, a.id DESC "
+                "LIMIT ?",
+                (*params, limit + 1),
+            )
+            yield from cursor
+        finally:
+            cursor.close()
 
     def get_derniers_articles(self):
-        connection = self.get_connection()
-        cursor = connection.cursor()
+        cursor = self._article_cursor()
 
         today_date = date.today()
 
         query = (
-            "SELECT id, titre, auteur, date_publication, contenu "
+            "SELECT id, titre, auteur, date_publication, contenu, "
+            "contenu_html "
             "FROM Articles "
             "WHERE date_publication <= ? "
             "ORDER BY date_publication DESC "
             "LIMIT 5"
         )
         cursor.execute(query, (today_date,))
-        articles_data = cursor.fetchall()
+        articles = cursor.fetchall()
 
         cursor.close()
 
-        articles = [
-            _build_article(article_data)
-            for article_data in articles_data
-        ]
-
         return articles
 
-    def search_articles(self, search_query):
-        connection = self.get_connection()
-        cursor = connection.cursor()
+    def search_articles(self, search_query, page=1, per_page=5):
+        match = fts_query(search_query)
+        if not match:
+            return [], 0
+        cursor = self._article_cursor()
         today_date = date.today()
 
+        # rank is bm25(10.0, 1.0) (migration 0014): titles weigh ten times
+        # more than the body, and FTS5 sorts the matches itself.
+        # The snippet is delimited by \x02/\x03 so that it can be escaped
+        # before the markers are turned into HTML.
         query = (
-            "SELECT id, titre, auteur, date_publication, contenu "
-            "FROM Articles "
-            "WHERE (titre LIKE ? OR contenu LIKE ?) AND date_publication <= ? "
-            "ORDER BY date_publication DESC "
-            "LIMIT 5"
+            "SELECT a.id, a.titre, a.auteur, a.date_publication, "
+            "snippet(articles_fts, 1, char(2), char(3), '…', 32) AS extrait "
+            "FROM articles_fts JOIN Articles a "
+            "ON a.rowid = articles_fts.rowid "
+            "WHERE articles_fts MATCH ? AND a.date_publication <= ? "
+            "ORDER BY rank "
+            "LIMIT ? OFFSET ?"
         )
-        cursor.execute(
-            query, (
-                "%" + search_query + "%", "%"
-                + search_query + "%", today_date
-            )
-        )
-        articles_data = cursor.fetchall()
+        offset = (page - 1) * per_page
+        cursor.execute(query, (match, today_date, per_page, offset))
+        articles = cursor.fetchall()
 
         cursor.close()
 
-        articles = [
-            _build_article(article_data)
-            for article_data in articles_data
-        ]
+        if articles and len(articles) < per_page:
+            total = offset + len(articles)
+        else:
+            total = self.count_search_results(search_query)
 
-        return articles
+        return articles, total
 
-    def add_article(self, titre, auteur, date_publication, contenu):
+    def count_search_results(self, search_query):
+        match = fts_query(search_query)
+        if not match:
+            return 0
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM articles_fts JOIN Articles a "
+            "ON a.rowid = articles_fts.rowid "
+            "WHERE articles_fts MATCH ? AND a.date_publication <= ?",
+            (match, date.today()),
+        )
+        total = cursor.fetchone()[0]
+        cursor.close()
+        return total
+
+    def rebuild_search_index(self):
         connection = self.get_connection()
+        connection.execute(
+            "INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')"
+        )
+        self._commit(connection)
 
-        cursor = connection.cursor()
-        cursor.execute("SELECT COUNT(*) FROM Articles")
-        cursor.close()
+    def add_article(
+        self, titre, auteur, date_publication, contenu, auteur_id=None
+    ):
+        connection = self.get_connection()
 
         identifiant = titre.replace(" ", "-")
 
         query = (
             "INSERT INTO Articles"
-            "(id,titre, auteur, date_publication, contenu) "
-            "VALUES(?, ?, ?, ?, ?)"
+            "(id,titre, auteur, date_publication, contenu, auteur_id, "
+            "contenu_html, rendu_version) "
+            "VALUES(?, ?, ?, ?, ?, ?, ?, ?)"
         )
         connection.execute(
-            query, (identifiant, titre, auteur, date_publication, contenu)
+            query,
+            (
+                identifiant, titre, auteur, date_publication, contenu,
+                auteur_id, render_contenu(contenu), RENDERER_VERSION,
+            ),
         )
-        connection.commit()
+        self._commit_changes(connection, ("article", identifiant))
 
         return identifiant
 
+    def add_articles(self, articles):
+        # One transaction for the whole batch; rows whose id already exists
+        # are skipped. New articles only change the listings, so a single
+        # change is logged for the batch.
+        connection = self.get_connection()
+        cursor = connection.executemany(
+            "INSERT INTO Articles("
+            + ", ".join(ARTICLE_EXPORT_COLUMNS)
+            + ", contenu_html, rendu_version) "
+            "VALUES(?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO NOTHING",
+            [
+                (*article, render_contenu(article[4]), RENDERER_VERSION)
+                for article in articles
+            ],
+        )
+        inserted = cursor.rowcount
+        if inserted > 0:
+            self._commit_changes(connection, ("article", articles[-1][0]))
+        else:
+            self._commit(connection)
+        return inserted
+
+    def iter_articles(self):
+        cursor = self.get_connection().cursor()
+        try:
+            cursor.execute(
+                "SELECT " + ", ".join(ARTICLE_EXPORT_COLUMNS)
+                + " FROM Articles ORDER BY rowid"
+            )
+            yield from cursor
+        finally:
+            cursor.close()
+
     def modify_article(self, id, titre, contenu):
         connection = self.get_connection()
 
-        query = "UPDATE Articles " "SET titre = ?, contenu = ? " "WHERE id = ?"
+        query = (
+            "UPDATE Articles "
+            "SET titre = ?, contenu = ?, contenu_html = ?, rendu_version = ? "
+            "WHERE id = ?"
+        )
 
-        connection.execute(query, (titre, contenu, id))
-        connection.commit()
+        connection.execute(
+            query,
+            (titre, contenu, render_contenu(contenu), RENDERER_VERSION, id),
+        )
+        self._commit_changes(connection, ("article", id))
 
         return id
 
-    def create_user(self, username, password, prenom, nom, courriel, pic_id):
+    def get_articles_to_render(self, version, after_rowid, limit):
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "SELECT rowid, id, contenu FROM Articles "
+            "WHERE rowid > ? AND rendu_version < ? "
+            "ORDER BY rowid LIMIT ?",
+            (after_rowid, version, limit),
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def save_rendered_articles(self, rendered, version):
+        # rendered holds (rowid, id, contenu_html). Only the HTML changes,
+        # so the search index (triggered on titre and contenu) and the
+        # title index are untouched: one change is logged for the batch.
+        if not rendered:
+            return
         connection = self.get_connection()
-        cursor = connection.cursor()
-        cursor.execute("SELECT COUNT(*) FROM Utilisateurs")
+        connection.executemany(
+            "UPDATE Articles SET contenu_html = ?, rendu_version = ? "
+            "WHERE rowid = ?",
+            [(html, version, rowid) for rowid, _, html in rendered],
+        )
+        self._commit_changes(connection, ("rendu", version))
 
-        id = cursor.fetchone()[0] + 1
+    def create_user(
+        self, username, password, prenom, nom, courriel, pic_id, picture=None
+    ):
+        # Returns the new id, or None when the username is already taken:
+        # the UNIQUE constraint does the check in the same statement.
+        connection = self.get_connection()
         salt = generate_salt()
         password = hash_password(password, salt)
 
-        connection.execute(
+        rows = connection.execute(
             (
                 "insert into Utilisateurs"
-                "(id,username, password_hash, salt,"
+                "(username, password_hash, salt,"
                 "prenom, nom, courriel, pic_id)"
-                " values(?, ?, ?, ?, ?, ?, ?, ?)"
+                " values(?, ?, ?, ?, ?, ?, ?)"
+                " on conflict(username) do nothing returning id"
             ),
-            (id, username, password, salt, prenom, nom, courriel, pic_id),
-        )
-        connection.commit()
-        connection.close()
+            (username, password, salt, prenom, nom, courriel, pic_id),
+        ).fetchall()
+        if not rows:
+            self._commit(connection)
+            return None
+        id = rows[0][0]
+        if picture is not None:
+            self._save_picture(connection, pic_id, picture)
+        self._commit_changes(connection, ("utilisateur", id))
+        return id
 
-    def create_picture(self, pic_id, file_data):
+    def add_users(self, users):
+        # New users appear on no cached page, so nothing is published.
         connection = self.get_connection()
-        file_data.seek(0)
-        file_content = file_data.read()
+        cursor = connection.executemany(
+            "INSERT INTO Utilisateurs("
+            + ", ".join(USER_EXPORT_COLUMNS)
+            + ") VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            users,
+        )
+        inserted = cursor.rowcount
+        self._commit(connection)
+        return inserted
+
+    def iter_users(self):
+        cursor = self.get_connection().cursor()
+        try:
+            cursor.execute(
+                "SELECT " + ", ".join(USER_EXPORT_COLUMNS)
+                + " FROM Utilisateurs ORDER BY id"
+            )
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def _save_picture(self, connection, pic_id, picture):
+        # `picture` is ("db", stream, taille) or ("fichier", sha256, taille).
+        # A stream is copied into the BLOB in fixed-size chunks, so the
+        # upload is never held in memory; the caller commits.
+        stockage, source, taille = picture
+        if stockage == "fichier":
+            connection.execute(
+                (
+                    "insert into ProfilPhotos(pic_id, photo_profil, sha256, "
+                    "date_modification, taille, stockage) "
+                    "values(?, x'', ?, ?, ?, 'fichier') "
+                    "on conflict(pic_id) do update set photo_profil = x'', "
+                    "sha256 = excluded.sha256, "
+                    "date_modification = excluded.date_modification, "
+                    "taille = excluded.taille, stockage = 'fichier'"
+                ),
+                (pic_id, source, time.time(), taille),
+            )
+            return
+        rowid = connection.execute(
+            (
+                "insert into ProfilPhotos(pic_id, photo_profil, sha256, "
+                "date_modification, taille, stockage) "
+                "values(?, zeroblob(?), '', ?, ?, 'db') "
+                "on conflict(pic_id) do update set "
+                "photo_profil = excluded.photo_profil, sha256 = '', "
+                "date_modification = excluded.date_modification, "
+                "taille = excluded.taille, stockage = 'db' "
+                "returning rowid"
+            ),
+            (pic_id, taille, time.time(), taille),
+        ).fetchall()[0][0]
+        digest = hashlib.sha256()
+        source.seek(0)
+        blob = connection.blobopen("ProfilPhotos", "photo_profil", rowid)
+        with blob:
+            for chunk in iter(lambda: source.read(BLOB_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                blob.write(chunk)
         connection.execute(
-            "insert into ProfilPhotos(pic_id, photo_profil) values(?, ?)",
-            (pic_id, file_content),
+            "update ProfilPhotos set sha256 = ? where rowid = ?",
+            (digest.hexdigest(), rowid),
         )
-        connection.commit()
 
-    def modify_picture(self, pic_id, photo):
+    def get_database_pictures(self):
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "select rowid, pic_id from ProfilPhotos where stockage = 'db'"
+        )
+        pictures = cursor.fetchall()
+        cursor.close()
+        return pictures
+
+    def move_picture_to_file(self, rowid, sha256):
         connection = self.get_connection()
-        photo.seek(0)
-        photo_data = photo.read()
-        query = (
-            "UPDATE ProfilPhotos "
-            "SET photo_profil = ? "
-            "WHERE pic_id = ?"
+        connection.execute(
+            (
+                "update ProfilPhotos set photo_profil = x'', sha256 = ?, "
+                "stockage = 'fichier' where rowid = ?"
+            ),
+            (sha256, rowid),
         )
+        self._commit(connection)
 
-        connection.execute(query, (photo_data, pic_id))
-        connection.commit()
+    def get_file_picture_digests(self):
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "select distinct sha256 from ProfilPhotos "
+            "where stockage = 'fichier'"
+        )
+        digests = {row[0] for row in cursor.fetchall()}
+        cursor.close()
+        return digests
 
-    def load_picture(self, pic_id):
+    def get_picture_info(self, pic_id):
         cursor = self.get_connection().cursor()
         cursor.execute(
-            ("select photo_profil from ProfilPhotos where pic_id=?"), (pic_id,)
+            (
+                "select rowid, taille, sha256, date_modification, stockage "
+                "from ProfilPhotos where pic_id=?"
+            ),
+            (pic_id,),
         )
         picture = cursor.fetchone()
-        if picture is None:
-            return None
-        else:
-            blob_data = picture[0]
-            return blob_data
+        cursor.close()
+        return picture
 
-    def get_photo(self, nom_prenom):
-        prenom, nom = nom_prenom.split()
-        connection = self.get_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            "SELECT pic_id FROM Utilisateurs WHERE nom = ? AND prenom = ?",
-            (nom, prenom),
+    def open_picture(self, rowid):
+        return self.get_connection().blobopen(
+            "ProfilPhotos", "photo_profil", rowid, readonly=True
         )
-        result = cursor.fetchone()
-        if result:
-            return result[0]
-        else:
-            return None
 
     def validate_user(self, username, password):
         connection = self.get_connection()
@@ -277,109 +823,110 @@ class Database:
         else:
             return False
 
-    def get_user_fullname(self, username):
-        connection = self.get_connection()
-        cursor = connection.cursor()
+    def get_author(self, username):
+        cursor = self.get_connection().cursor()
         cursor.execute(
-            "SELECT prenom,nom FROM Utilisateurs WHERE username = ?",
+            "SELECT id, prenom, nom FROM Utilisateurs WHERE username = ?",
             (username,)
         )
         user_data = cursor.fetchone()
+        cursor.close()
 
         if user_data is None:
-            return None
+            return None, None
 
-        prenom, nom = user_data
-        return f"{prenom} {nom}"
+        id, prenom, nom = user_data
+        return id, f"{prenom} {nom}"
 
     def get_user(self, id):
-        connection = self.get_connection()
-        cursor = connection.cursor()
-        cursor.execute("SELECT * FROM Utilisateurs WHERE id = ?", (id,))
-        user_data = cursor.fetchone()
-
-        if not user_data:
-            return None
-
-        return _build_user(user_data)
+        cursor = self._user_cursor()
+        cursor.execute(
+            "SELECT " + USER_COLUMNS + " FROM Utilisateurs WHERE id = ?",
+            (id,),
+        )
+        user = cursor.fetchone()
+        cursor.close()
 
-    def get_user_status(self, id):
-        connection = self.get_connection()
-        cursor = connection.cursor()
-        cursor.execute("SELECT actif FROM Utilisateurs WHERE id = ?", (id,))
-        return cursor.fetchone()[0]
+        return user
 
     def modify_user_status(self, id):
+        # Returns False when there is no such user.
         connection = self.get_connection()
-        actif = self.get_user_status(id)
-        query = "UPDATE Utilisateurs " "SET actif = ? " "WHERE id = ?"
+        query = "UPDATE Utilisateurs " "SET actif = NOT actif " "WHERE id = ?"
 
-        connection.execute(query, (not actif, id))
-        connection.commit()
-
-    def get_password(self, id):
-        connection = self.get_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            "SELECT password_hash,salt FROM Utilisateurs WHERE id = ?", (id,)
-        )
-        password_data = cursor.fetchone()
-
-        if password_data:
-            password_hash, salt = password_data
-            return password_hash, salt
-        else:
-            return None
+        cursor = connection.execute(query, (id,))
+        if cursor.rowcount == 0:
+            self._commit(connection)
+            return False
+        self._commit_changes(connection, ("utilisateur", id))
+        return True
 
     def get_all_users(self):
-        connection = self.get_connection()
-        cursor = connection.cursor()
-        cursor.execute("SELECT * FROM Utilisateurs")
-        users_data = cursor.fetchall()
+        cursor = self._user_cursor()
+        cursor.execute("SELECT " + USER_COLUMNS + " FROM Utilisateurs")
+        users = cursor.fetchall()
+        cursor.close()
 
-        if not users_data:
+        if not users:
             return None
 
-        users = [_build_user(user_data) for user_data in users_data]
-
         return users
 
-    def modify_user(self, id, password, prenom, nom, courriel, pic_id):
+    def modify_user(
+        self, id, password, prenom, nom, courriel, pic_id, picture=None
+    ):
+        # Without a new password the stored hash and salt are kept.
         connection = self.get_connection()
         if not password:
-            password_hash, salt = self.get_password(id)
+            password_hash = salt = None
         else:
             salt = generate_salt()
             password_hash = hash_password(password, salt)
 
         query = (
             "UPDATE Utilisateurs "
-            "SET password_hash = ?, salt = ?, prenom = ?,"
+            "SET password_hash = coalesce(?, password_hash), "
+            "salt = coalesce(?, salt), prenom = ?,"
             "nom = ?, courriel = ?, pic_id = ? "
             "WHERE id = ?"
         )
 
-        connection.execute(
+        cursor = connection.execute(
             query, (password_hash, salt, prenom, nom, courriel, pic_id, id)
         )
-        connection.commit()
-
-    def is_username_taken(self, username):
-        cursor = self.get_connection().cursor()
-        cursor.execute(
-            ("SELECT COUNT(*) FROM Utilisateurs where username = ?"),
-            (username,)
-        )
-        data = cursor.fetchone()[0]
-        return data > 0
-
-    def save_session(self, id_session, username):
+        if cursor.rowcount == 0:
+            self._commit(connection)
+            return False
+        if picture is not None:
+            self._save_picture(connection, pic_id, picture)
+        # Articles.auteur is the name every page shows and the author
+        # filters match, so it follows the account. Article pages are
+        # tagged with their author; one article change is enough to
+        # refresh the listings.
+        auteur = f"{prenom} {nom}"
+        renamed = connection.execute(
+            "UPDATE Articles SET auteur = ? "
+            "WHERE auteur_id = ? AND auteur <> ? RETURNING id",
+            (auteur, id, auteur),
+        ).fetchall()
+        changes = [("utilisateur", id)]
+        if renamed:
+            changes.append(("article", renamed[0][0]))
+        self._commit_changes(connection, *changes)
+        return True
+
+    def save_session(self, id_session, username, now=None):
+        if now is None:
+            now = time.time()
         connection = self.get_connection()
         connection.execute(
-            ("insert into sessions(id_session, utilisateur) " "values(?, ?)"),
-            (id_session, username),
+            (
+                "insert into sessions(id_session, utilisateur, "
+                "date_creation, derniere_activite) values(?, ?, ?, ?)"
+            ),
+            (id_session, username, now, now),
         )
-        connection.commit()
+        self._commit(connection)
 
     def delete_session(self, id_session):
         connection = self.get_connection()
@@ -387,25 +934,40 @@ class Database:
             ("delete from sessions where id_session=?"),
             (id_session,)
         )
-        connection.commit()
+        # Logged so that every process drops the session from its cache.
+        self._commit_changes(connection, ("session", id_session))
 
-    def get_session(self, id_session):
+    def get_session_record(self, id_session):
         cursor = self.get_connection().cursor()
         cursor.execute(
-            ("select utilisateur from sessions where id_session=?"),
+            (
+                "select utilisateur, date_creation, derniere_activite "
+                "from sessions where id_session=?"
+            ),
             (id_session,)
         )
         data = cursor.fetchone()
-        if data is None:
-            return None
-        else:
-            return data[0]
+        cursor.close()
+        return data
 
-    def is_session_active(self, id_session):
+    def touch_session(self, id_session, now):
         connection = self.get_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            "SELECT COUNT(*) FROM sessions WHERE id_session = ?", (id_session,)
+        connection.execute(
+            "update sessions set derniere_activite=? where id_session=?",
+            (now, id_session),
+        )
+        self._commit(connection)
+
+    def delete_expired_sessions(self, idle_before, created_before, limit):
+        connection = self.get_connection()
+        cursor = connection.execute(
+            (
+                "delete from sessions where id in ("
+                "select id from sessions where derniere_activite < ? "
+                "union select id from sessions where date_creation < ? "
+                "limit ?)"
+            ),
+            (idle_before, created_before, limit),
         )
-        count = cursor.fetchone()[0]
-        return count > 0
+        self._commit(connection)
+        return cursor.rowcount
@@ -0,0 +1,26 @@
+-- Index plein texte de /recherche, synchronisé par des déclencheurs.
+-- Articles n'a pas de INTEGER PRIMARY KEY : après un VACUUM, exécuter
+-- INSERT INTO articles_fts(articles_fts) VALUES ('rebuild').
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    titre, contenu,
+    content='Articles', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS articles_fts_ai
+AFTER INSERT ON Articles BEGIN
+    INSERT INTO articles_fts(rowid, titre, contenu)
+    VALUES (new.rowid, new.titre, new.contenu);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_fts_ad
+AFTER DELETE ON Articles BEGIN
+    INSERT INTO articles_fts(articles_fts, rowid, titre, contenu)
+    VALUES ('delete', old.rowid, old.titre, old.contenu);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_fts_au
+AFTER UPDATE OF titre, contenu ON Articles BEGIN
+    INSERT INTO articles_fts(articles_fts, rowid, titre, contenu)
+    VALUES ('delete', old.rowid, old.titre, old.contenu);
+    INSERT INTO articles_fts(rowid, titre, contenu)
+    VALUES (new.rowid, new.titre, new.contenu);
+END;
+INSERT INTO articles_fts(articles_fts) VALUES ('rebuild');
@@ -0,0 +1,28 @@
+# Horodatage des sessions pour l'expiration (inactivité et durée maximale).
+import time
+
+
+def upgrade(connection):
+    columns = [
+        row[1] for row in connection.execute("PRAGMA table_info(sessions)")
+    ]
+    if "date_creation" not in columns:
+        now = time.time()
+        connection.execute(
+            "ALTER TABLE sessions ADD COLUMN date_creation REAL"
+        )
+        connection.execute(
+            "ALTER TABLE sessions ADD COLUMN derniere_activite REAL"
+        )
+        connection.execute(
+            "UPDATE sessions SET date_creation = ?, derniere_activite = ?",
+            (now, now),
+        )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS sessions_date_creation "
+        "ON sessions(date_creation)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS sessions_derniere_activite "
+        "ON sessions(derniere_activite)"
+    )
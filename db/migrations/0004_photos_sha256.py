@@ -0,0 +1,34 @@
+# Empreinte SHA-256 (ETag) et date de modification des photos de profil.
+import hashlib
+import time
+
+CHUNK_SIZE = 64 * 1024
+
+
+def upgrade(connection):
+    columns = [
+        row[1]
+        for row in connection.execute("PRAGMA table_info(ProfilPhotos)")
+    ]
+    if "sha256" not in columns:
+        connection.execute("ALTER TABLE ProfilPhotos ADD COLUMN sha256 TEXT")
+    if "date_modification" not in columns:
+        connection.execute(
+            "ALTER TABLE ProfilPhotos ADD COLUMN date_modification REAL"
+        )
+    now = time.time()
+    rows = connection.execute(
+        "SELECT rowid FROM ProfilPhotos WHERE sha256 IS NULL"
+    ).fetchall()
+    for (rowid,) in rows:
+        digest = hashlib.sha256()
+        with connection.blobopen(
+            "ProfilPhotos", "photo_profil", rowid, readonly=True
+        ) as blob:
+            for chunk in iter(lambda: blob.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        connection.execute(
+            "UPDATE ProfilPhotos SET sha256 = ?, date_modification = ? "
+            "WHERE rowid = ?",
+            (digest.hexdigest(), now, rowid),
+        )
@@ -0,0 +1,21 @@
+# Emplacement des photos ('db' ou 'fichier') et taille en octets.
+
+
+def upgrade(connection):
+    columns = [
+        row[1]
+        for row in connection.execute("PRAGMA table_info(ProfilPhotos)")
+    ]
+    if "stockage" not in columns:
+        connection.execute(
+            "ALTER TABLE ProfilPhotos "
+            "ADD COLUMN stockage TEXT NOT NULL DEFAULT 'db'"
+        )
+    if "taille" not in columns:
+        connection.execute(
+            "ALTER TABLE ProfilPhotos ADD COLUMN taille INTEGER"
+        )
+    connection.execute(
+        "UPDATE ProfilPhotos SET taille = length(photo_profil) "
+        "WHERE taille IS NULL"
+    )
@@ -0,0 +1,8 @@
+-- Journal des écritures relu par les autres processus (cache des pages).
+CREATE TABLE IF NOT EXISTS change_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sujet TEXT NOT NULL,
+    cle TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    date_creation REAL NOT NULL
+);
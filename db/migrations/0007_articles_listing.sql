@@ -0,0 +1,4 @@
+-- Index couvrant de la liste paginée de /admin, aussi utilisé par le tri
+-- par date de la page d'accueil.
+CREATE INDEX IF NOT EXISTS articles_listing
+ON Articles(date_publication, id, titre, auteur);
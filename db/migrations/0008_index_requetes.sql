@@ -0,0 +1,5 @@
+-- Index manquants relevés par flask db check.
+CREATE INDEX IF NOT EXISTS utilisateurs_nom_prenom
+ON Utilisateurs(nom, prenom);
+CREATE INDEX IF NOT EXISTS change_log_date_creation
+ON change_log(date_creation);
@@ -0,0 +1,17 @@
+-- Auteur des articles comme clé étrangère vers Utilisateurs. Les articles
+-- existants sont rattachés par « prénom nom » ; ceux dont l'auteur n'a
+-- pas de compte gardent auteur_id NULL. Les noms sont d'abord indexés
+-- dans une table temporaire : une recherche par article, pas un parcours
+-- des utilisateurs.
+ALTER TABLE Articles ADD COLUMN auteur_id INTEGER REFERENCES Utilisateurs(id);
+CREATE TEMP TABLE auteurs_par_nom(nom TEXT PRIMARY KEY, id INTEGER)
+WITHOUT ROWID;
+INSERT INTO auteurs_par_nom(nom, id)
+SELECT prenom || ' ' || nom, MIN(id) FROM Utilisateurs
+WHERE prenom IS NOT NULL AND nom IS NOT NULL
+GROUP BY prenom || ' ' || nom;
+UPDATE Articles SET auteur_id = (
+    SELECT id FROM auteurs_par_nom WHERE nom = Articles.auteur
+);
+DROP TABLE auteurs_par_nom;
+CREATE INDEX IF NOT EXISTS articles_auteur_id ON Articles(auteur_id);
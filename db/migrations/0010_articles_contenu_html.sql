@@ -0,0 +1,5 @@
+-- Contenu rendu en HTML nettoyé à l'écriture, avec la version du rendu qui
+-- l'a produit. Les articles existants (rendu_version 0) sont rendus par
+-- « flask articles rendre ».
+ALTER TABLE Articles ADD COLUMN contenu_html TEXT;
+ALTER TABLE Articles ADD COLUMN rendu_version INTEGER NOT NULL DEFAULT 0;
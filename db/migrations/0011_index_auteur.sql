@@ -0,0 +1,5 @@
+-- Filtre par auteur de /admin/articles, dans l'ordre de la pagination.
+-- L'index sur (nom, prenom) ne servait qu'à get_photo, supprimée.
+CREATE INDEX IF NOT EXISTS articles_auteur
+ON Articles(auteur, date_publication, id);
+DROP INDEX IF EXISTS utilisateurs_nom_prenom;
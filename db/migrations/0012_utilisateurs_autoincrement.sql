@@ -0,0 +1,28 @@
+-- Un identifiant d'utilisateur n'est jamais réattribué : sans
+-- AUTOINCREMENT, un compte créé après la suppression du dernier
+-- hériterait de ses articles (auteur_id) et des pages en cache. La
+-- séquence part aussi des auteur_id d'articles dont le compte n'existe
+-- plus.
+CREATE TABLE Utilisateurs_nouveau (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(25) UNIQUE NOT NULL,
+    password_hash VARCHAR(128) NOT NULL,
+    salt VARCHAR(32) NOT NULL,
+    nom VARCHAR(20) NOT NULL,
+    prenom VARCHAR(20) NOT NULL,
+    courriel VARCHAR(100) NOT NULL,
+    actif BOOLEAN DEFAULT TRUE,
+    pic_id VARCHAR(32));
+INSERT INTO Utilisateurs_nouveau
+SELECT id, username, password_hash, salt, nom, prenom, courriel, actif,
+    pic_id
+FROM Utilisateurs;
+DROP TABLE Utilisateurs;
+ALTER TABLE Utilisateurs_nouveau RENAME TO Utilisateurs;
+DELETE FROM sqlite_sequence WHERE name = 'Utilisateurs';
+INSERT INTO sqlite_sequence(name, seq) VALUES('Utilisateurs', (
+    SELECT MAX(COALESCE(MAX(u.id), 0), (
+        SELECT COALESCE(MAX(auteur_id), 0) FROM Articles
+    ))
+    FROM Utilisateurs u
+));
@@ -0,0 +1,7 @@
+-- Articles.auteur est le seul nom d'auteur affiché : il reprend le nom
+-- actuel des comptes renommés avant que modify_user ne le mette à jour.
+UPDATE Articles SET auteur = (
+    SELECT u.prenom || ' ' || u.nom FROM Utilisateurs u
+    WHERE u.id = Articles.auteur_id
+)
+WHERE auteur_id IN (SELECT id FROM Utilisateurs);
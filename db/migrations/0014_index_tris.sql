@@ -0,0 +1,8 @@
+-- Tris des requêtes fréquentes sans B-tree temporaire. /recherche trie
+-- par la colonne rank de FTS5, le titre pesant dix fois plus que le
+-- texte ; FTS5 classe alors lui-même les résultats.
+INSERT INTO articles_fts(articles_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)');
+-- Filtre par auteur_id de l'API, dans l'ordre de la pagination.
+CREATE INDEX IF NOT EXISTS articles_auteur_id_listing
+ON Articles(auteur_id, date_publication, id);
+DROP INDEX IF EXISTS articles_auteur_id;
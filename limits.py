@@ -0,0 +1,117 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import METRICS
+
+
+class TokenBucket:
+    # Holds up to `burst` tokens, refilled at `rate` tokens per second.
+    # Not thread-safe: RouteLimiter calls it under its own lock.
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def wait(self):
+        # Seconds until one token is available (0 when there is one).
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RouteLimiter:
+    # One global bucket, one bucket per client address and a maximum of
+    # requests in progress. A request takes a token from both buckets or
+    # from none, so that rejected requests do not drain the global one.
+    # The least recently seen clients are forgotten past max_clients: their
+    # bucket would have refilled by then anyway.
+    def __init__(self, rate, burst, client_rate, client_burst, concurrency,
+                 max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.concurrency = concurrency
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self._bucket = TokenBucket(rate, burst, time.monotonic())
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, client):
+        # Returns (None, 0) when the request may proceed, and must then be
+        # followed by release(); otherwise the exceeded limit and the
+        # number of seconds after which to retry.
+        now = time.monotonic()
+        with self._lock:
+            if self.in_flight >= self.concurrency:
+                return "concurrence", 1
+            bucket = self._clients.get(client)
+            if bucket is None:
+                bucket = TokenBucket(self.client_rate, self.client_burst, now)
+                self._clients[client] = bucket
+                if len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(client)
+                bucket.refill(now)
+            wait = bucket.wait()
+            if wait:
+                return "client", wait
+            self._bucket.refill(now)
+            wait = self._bucket.wait()
+            if wait:
+                return "globale", wait
+            bucket.tokens -= 1
+            self._bucket.tokens -= 1
+            self.in_flight += 1
+        return None, 0
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def client_count(self):
+        return len(self._clients)
+
+
+class RateLimits:
+    # Limiters by endpoint, built from the RATE_LIMITS setting.
+    def __init__(self, limits):
+        self.limiters = {
+            endpoint: RouteLimiter(**settings)
+            for endpoint, settings in limits.items()
+        }
+
+    def acquire(self, endpoint, client):
+        # Returns the limiter to release, None when the endpoint is not
+        # limited, or the number of whole seconds to send in Retry-After.
+        limiter = self.limiters.get(endpoint)
+        if limiter is None:
+            return None, 0
+        limite, wait = limiter.acquire(client)
+        labels = (("endpoint", endpoint),)
+        if limite is None:
+            METRICS.inc("rate_limit_allowed_total", labels)
+            return limiter, 0
+        METRICS.inc(
+            "rate_limit_rejected_total", (*labels, ("limite", limite))
+        )
+        return None, max(1, math.ceil(wait))
+
+    def gauges(self):
+        for endpoint, limiter in sorted(self.limiters.items()):
+            labels = (("endpoint", endpoint),)
+            yield ("rate_limit_in_flight", labels, limiter.in_flight)
+            yield ("rate_limit_clients", labels, limiter.client_count())
@@ -0,0 +1,226 @@
+import bisect
+import inspect
+import threading
+import time
+from functools import wraps
+
+DURATION_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0,
+)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024,
+    4 * 1024 * 1024,
+)
+
+HELP = {
+    "http_requests_total": ("counter", "Requêtes HTTP traitées."),
+    "http_request_duration_seconds": (
+        "histogram",
+        "Durée des requêtes HTTP jusqu'au premier octet de la réponse.",
+    ),
+    "http_response_size_bytes": (
+        "histogram",
+        "Taille des réponses HTTP (hors réponses en flux).",
+    ),
+    "db_calls_total": ("counter", "Appels des méthodes de Database."),
+    "db_errors_total": ("counter", "Appels de Database en erreur."),
+    "db_call_duration_seconds": (
+        "histogram",
+        "Durée des méthodes de Database.",
+    ),
+    "db_connections_opened_total": (
+        "counter",
+        "Connexions SQLite ouvertes par le pool.",
+    ),
+    "db_connections_idle": ("gauge", "Connexions SQLite libres du pool."),
+    "page_cache_hits_total": ("counter", "Pages servies depuis le cache."),
+    "page_cache_misses_total": ("counter", "Pages absentes du cache."),
+    "page_cache_size_bytes": ("gauge", "Taille des pages en cache."),
+    "session_cache_hits_total": ("counter", "Sessions trouvées en cache."),
+    "session_cache_misses_total": ("counter", "Sessions lues dans la base."),
+    "rate_limit_allowed_total": (
+        "counter",
+        "Requêtes admises par les limites de débit.",
+    ),
+    "rate_limit_rejected_total": (
+        "counter",
+        "Requêtes refusées (429), par limite dépassée.",
+    ),
+    "rate_limit_in_flight": ("gauge", "Requêtes limitées en cours."),
+    "rate_limit_clients": ("gauge", "Adresses clientes suivies."),
+}
+
+
+class Metrics:
+    # Every thread records into its own shard, so recording never takes a
+    # lock; render() sums the shards. Shards of finished threads are
+    # folded into a single one so that their number stays bounded.
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = ({}, {})
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = ({}, {})
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        histograms = self._shard()[1]
+        key = (name, labels, buckets)
+        entry = histograms.get(key)
+        if entry is None:
+            # One count per bucket, then +Inf, then the sum.
+            entry = histograms[key] = [0] * (len(buckets) + 2)
+        entry[bisect.bisect_left(buckets, value)] += 1
+        entry[-1] += value
+
+    def _merge(self, target, shard):
+        counters, histograms = target
+        for key, value in list(shard[0].items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, entry in list(shard[1].items()):
+            total = histograms.get(key)
+            if total is None:
+                total = histograms[key] = [0] * len(entry)
+            for i, value in enumerate(list(entry)):
+                total[i] += value
+
+    def snapshot(self):
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            snapshot = ({}, {})
+            self._merge(snapshot, self._retired)
+            for _, shard in alive:
+                self._merge(snapshot, shard)
+        return snapshot
+
+    def render(self, gauges=()):
+        counters, histograms = self.snapshot()
+        families = {}
+        for (name, labels), value in sorted(counters.items()):
+            families.setdefault(name, []).append(
+                f"{name}{_labels(labels)} {_number(value)}"
+            )
+        for name, labels, value in sorted(gauges):
+            families.setdefault(name, []).append(
+                f"{name}{_labels(labels)} {_number(value)}"
+            )
+        for (name, labels, buckets), entry in sorted(histograms.items()):
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), entry):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append(
+                    f"{name}_bucket{_labels((*labels, ('le', le)))} "
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{name}_sum{_labels(labels)} {_number(entry[-1])}"
+            )
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        output = []
+        for name in sorted(families):
+            kind, description = HELP.get(name, ("untyped", name))
+            output.append(f"# HELP {name} {description}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(families[name])
+        return "\n".join(output) + "\n"
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = (
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n")
+        )
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+METRICS = Metrics()
+
+
+def _record_call(name, started, failed):
+    labels = (("methode", name),)
+    METRICS.inc("db_calls_total", labels)
+    if failed:
+        METRICS.inc("db_errors_total", labels)
+    METRICS.observe(
+        "db_call_duration_seconds", labels, time.perf_counter() - started
+    )
+
+
+def _timed(name, method):
+    if inspect.isgeneratorfunction(method):
+        # Generators are timed from the first row to the last.
+        @wraps(method)
+        def timed_generator(*args, **kwargs):
+            started = time.perf_counter()
+            failed = False
+            try:
+                yield from method(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                _record_call(name, started, failed)
+
+        return timed_generator
+
+    @wraps(method)
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            _record_call(name, started, failed)
+
+    return timed
+
+
+def instrument(*exclude):
+    # Class decorator: times every public method not listed in `exclude`.
+    def decorator(cls):
+        for name, method in list(vars(cls).items()):
+            if (
+                not name.startswith("_")
+                and name not in exclude
+                and inspect.isfunction(method)
+            ):
+                setattr(cls, name, _timed(name, method))
+        return cls
+
+    return decorator
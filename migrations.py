@@ -0,0 +1,463 @@
+import importlib.util
+import os
+import re
+import sqlite3
+import time
+from collections import namedtuple
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .database import Database, get_pool
+from .metrics import METRICS
+
+MIGRATIONS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "db", "migrations"
+)
+
+Migration = namedtuple("Migration", ["version", "nom", "path"])
+
+
+def discover_migrations(directory=MIGRATIONS_DIRECTORY):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = re.match(r"^(\d{4})_(\w+)\.(sql|py)$", filename)
+        if match:
+            migrations.append(
+                Migration(
+                    int(match.group(1)),
+                    match.group(2),
+                    os.path.join(directory, filename),
+                )
+            )
+    migrations.sort()
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration version in {directory}")
+    return migrations
+
+
+def split_statements(sql):
+    # complete_statement() knows about BEGIN ... END inside triggers, so
+    # only the semicolons that really end a statement split the script.
+    statements = []
+    buffer = ""
+    for part in sql.split(";"):
+        buffer += part + ";"
+        if sqlite3.complete_statement(buffer):
+            statement = buffer.strip()
+            if statement.strip(";").strip():
+                statements.append(statement)
+            buffer = ""
+    if buffer.strip(" \n\t;"):
+        statements.append(buffer.strip())
+    return statements
+
+
+def _ensure_version_table(connection):
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "nom TEXT NOT NULL, "
+        "date_application REAL NOT NULL)"
+    )
+
+
+def current_version(connection):
+    _ensure_version_table(connection)
+    row = connection.execute(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+    ).fetchone()
+    return row[0]
+
+
+def _run_migration(connection, migration):
+    if migration.path.endswith(".sql"):
+        with open(migration.path, encoding="utf-8") as script:
+            for statement in split_statements(script.read()):
+                connection.execute(statement)
+    else:
+        spec = importlib.util.spec_from_file_location(
+            f"migration_{migration.version:04d}", migration.path
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(connection)
+
+
+def upgrade_connection(connection, target=None):
+    applied = []
+    _ensure_version_table(connection)
+    for migration in discover_migrations():
+        if target is not None and migration.version > target:
+            break
+        # Each migration runs in its own BEGIN IMMEDIATE transaction; the
+        # version is checked inside it so that concurrent processes never
+        # apply the same migration twice.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(connection) >= migration.version:
+                connection.rollback()
+                continue
+            _run_migration(connection, migration)
+            connection.execute(
+                "INSERT INTO schema_version(version, nom, date_application) "
+                "VALUES(?, ?, ?)",
+                (migration.version, migration.nom, time.time()),
+            )
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+        applied.append(migration)
+    return applied
+
+
+def upgrade(database_path, target=None):
+    pool = get_pool(database_path)
+    connection = pool.acquire()
+    try:
+        return upgrade_connection(connection, target)
+    finally:
+        pool.release(connection)
+
+
+def _sample(connection, query, default):
+    row = connection.execute(query).fetchone()
+    return row if row is not None else default
+
+
+# Every Database query, reached through the public methods. "Hot" queries
+# are those on request paths; they must neither scan a table or an index
+# without a LIMIT nor sort in a temporary B-tree. `flask db check` fails
+# when a public method is missing from this list.
+def _open_picture(db):
+    # Adds a picture first, so that there is one to open in any database.
+    db.create_user(
+        "verification", "x", "Prenom", "Nom", "", "verification",
+        ("fichier", "0" * 64, 0),
+    )
+    rowid = db.get_picture_info("verification")[0]
+    with db.open_picture(rowid):
+        pass
+
+
+def _query_workload(connection):
+    article_id, auteur = _sample(
+        connection,
+        "SELECT id, auteur FROM Articles LIMIT 1",
+        ("inexistant", "Prenom Nom"),
+    )
+    user_id, username = _sample(
+        connection,
+        "SELECT id, username FROM Utilisateurs LIMIT 1",
+        (1, "inexistant"),
+    )
+    pic_rowid, pic_id = _sample(
+        connection, "SELECT rowid, pic_id FROM ProfilPhotos LIMIT 1", (0, "0")
+    )
+    (id_session,) = _sample(
+        connection, "SELECT id_session FROM sessions LIMIT 1", ("0",)
+    )
+    if len(auteur.split()) != 2:
+        auteur = "Prenom Nom"
+    return [
+        (True, "get_article", lambda db: db.get_article(article_id)),
+        (
+            True,
+            "get_article_title",
+            lambda db: db.get_article_title(article_id),
+        ),
+        (
+            True,
+            "get_article_titles (nouveaux)",
+            lambda db: db.get_article_titles(1 << 62),
+        ),
+        (
+            True,
+            "get_article_with_author",
+            lambda db: db.get_article_with_author(article_id),
+        ),
+        (True, "get_author", lambda db: db.get_author(username)),
+        (True, "get_derniers_articles", lambda db: db.get_derniers_articles()),
+        (True, "search_articles", lambda db: db.search_articles("test")),
+        (True, "get_articles_page", lambda db: db.get_articles_page(20)),
+        (
+            True,
+            "iter_published_articles",
+            lambda db: list(db.iter_published_articles(20)),
+        ),
+        (
+            True,
+            "iter_published_articles (auteur_id)",
+            lambda db: list(
+                db.iter_published_articles(
+                    20, apres=["2024-01-01", article_id], auteur_id=user_id
+                )
+            ),
+        ),
+        (
+            True,
+            "get_articles_page (curseur)",
+            lambda db: db.get_articles_page(
+                20, apres=["2024-01-01", article_id]
+            ),
+        ),
+        (True, "get_picture_info", lambda db: db.get_picture_info(pic_id)),
+        (True, "open_picture", _open_picture),
+        (True, "validate_user", lambda db: db.validate_user(username, "x")),
+        (True, "get_user", lambda db: db.get_user(user_id)),
+        (
+            True,
+            "get_session_record",
+            lambda db: db.get_session_record(id_session),
+        ),
+        (True, "get_last_change_id", lambda db: db.get_last_change_id()),
+        (
+            True,
+            "get_changes_since",
+            lambda db: db.get_changes_since(0, 1000),
+        ),
+        (
+            True,
+            "modify_article",
+            lambda db: db.modify_article(article_id, "titre", "contenu"),
+        ),
+        (
+            True,
+            "modify_user_status",
+            lambda db: db.modify_user_status(user_id),
+        ),
+        (
+            True,
+            "create_user",
+            lambda db: db.create_user(
+                username, "x", "Prenom", "Nom", "", None
+            ),
+        ),
+        (
+            True,
+            "modify_user",
+            lambda db: db.modify_user(
+                user_id, "", "Prenom", "Nom", "", None
+            ),
+        ),
+        (
+            True,
+            "add_article",
+            lambda db: db.add_article(
+                "Verification du plan", auteur, "2024-01-01", "contenu",
+                user_id,
+            ),
+        ),
+        (
+            True,
+            "save_session",
+            lambda db: db.save_session("verification", username),
+        ),
+        (True, "touch_session", lambda db: db.touch_session(id_session, 0)),
+        (True, "delete_session", lambda db: db.delete_session(id_session)),
+        (False, "get_all_users", lambda db: db.get_all_users()),
+        (
+            True,
+            "get_articles_page (auteur)",
+            lambda db: db.get_articles_page(20, auteur=auteur),
+        ),
+        (
+            False,
+            "delete_expired_sessions",
+            lambda db: db.delete_expired_sessions(0, 0, 500),
+        ),
+        (
+            False,
+            "delete_changes_before",
+            lambda db: db.delete_changes_before(0),
+        ),
+        (
+            False,
+            "get_database_pictures",
+            lambda db: db.get_database_pictures(),
+        ),
+        (False, "get_article_titles", lambda db: db.get_article_titles()),
+        (
+            False,
+            "get_file_picture_digests",
+            lambda db: db.get_file_picture_digests(),
+        ),
+        (
+            False,
+            "move_picture_to_file",
+            lambda db: db.move_picture_to_file(pic_rowid, "0" * 64),
+        ),
+        (
+            False,
+            "rebuild_search_index",
+            lambda db: db.rebuild_search_index(),
+        ),
+        (
+            False,
+            "get_articles_to_render",
+            lambda db: db.get_articles_to_render(1, 0, 500),
+        ),
+        (
+            False,
+            "save_rendered_articles",
+            lambda db: db.save_rendered_articles([(1, article_id, "")], 1),
+        ),
+        (False, "iter_articles", lambda db: next(db.iter_articles(), None)),
+        (False, "iter_users", lambda db: next(db.iter_users(), None)),
+        (
+            False,
+            "add_articles",
+            lambda db: db.add_articles(
+                [(article_id, "titre", auteur, "2024-01-01", "contenu", None)]
+            ),
+        ),
+        (
+            False,
+            "add_users",
+            lambda db: db.add_users(
+                [(None, username, "", "", "Prenom", "Nom", "", True, None)]
+            ),
+        ),
+    ]
+
+
+def is_full_scan(detail, statement):
+    # A SCAN walks a table or an index from one end; only a LIMIT stops
+    # it early. A virtual table given constraints (FTS5 MATCH) searches.
+    if not detail.startswith("SCAN ") or detail == "SCAN CONSTANT ROW":
+        return False
+    if re.search(r"VIRTUAL TABLE INDEX \d+:\S", detail):
+        return False
+    return re.search(r"\bLIMIT\b", statement, re.IGNORECASE) is None
+
+
+def is_temp_sort(detail):
+    # ORDER BY, GROUP BY, DISTINCT or UNION that reads every row first.
+    return "TEMP B-TREE" in detail
+
+
+def _public_methods():
+    # The methods metrics.instrument() wraps: every public query method.
+    return {
+        name
+        for name, attr in vars(Database).items()
+        if hasattr(attr, "__wrapped__")
+    }
+
+
+def _call_counts():
+    counters = METRICS.snapshot()[0]
+    return {
+        labels[0][1]: count
+        for (name, labels), count in counters.items()
+        if name == "db_calls_total"
+    }
+
+
+def check_query_plans(database_path):
+    # Works on an in-memory copy, brought up to date, so that the write
+    # methods of the workload can run without touching the real database.
+    memory = sqlite3.connect(":memory:", check_same_thread=False)
+    source = sqlite3.connect(database_path)
+    try:
+        source.backup(memory)
+    finally:
+        source.close()
+    upgrade_connection(memory)
+
+    report = []
+    db = Database(database_path)
+    db.connection = memory
+    before = _call_counts()
+    try:
+        for hot, nom, call in _query_workload(memory):
+            statements = []
+            memory.set_trace_callback(statements.append)
+            try:
+                call(db)
+            finally:
+                memory.set_trace_callback(None)
+            for statement in dict.fromkeys(statements):
+                # Skips transaction control, trigger markers and the
+                # statements FTS5 issues against its own shadow tables.
+                if re.match(
+                    r"^\s*(--|BEGIN|COMMIT|ROLLBACK|PRAGMA)",
+                    statement,
+                    re.IGNORECASE,
+                ) or "'main'." in statement:
+                    continue
+                plan = [
+                    row[3]
+                    for row in memory.execute(
+                        "EXPLAIN QUERY PLAN " + statement
+                    )
+                ]
+                problems = [
+                    detail
+                    for detail in plan
+                    if is_full_scan(detail, statement) or is_temp_sort(detail)
+                ]
+                report.append((nom, hot, statement, plan, problems))
+    finally:
+        db.connection = None
+        memory.close()
+    after = _call_counts()
+    called = {
+        name for name, count in after.items() if count > before.get(name, 0)
+    }
+    return report, sorted(_public_methods() - called)
+
+
+db_cli = AppGroup("db", help="Schéma de la base de données.")
+
+
+@db_cli.command("upgrade")
+@click.option("--target", type=int, help="Version à atteindre.")
+def upgrade_command(target):
+    """Applique les migrations de db/migrations."""
+    applied = upgrade(current_app.config["DATABASE"], target)
+    for migration in applied:
+        click.echo(f"{migration.version:04d} {migration.nom}")
+    click.echo(f"{len(applied)} migration(s) appliquée(s).")
+
+
+@db_cli.command("version")
+def version_command():
+    """Affiche la version du schéma."""
+    db = Database(current_app.config["DATABASE"])
+    try:
+        click.echo(current_version(db.get_connection()))
+    finally:
+        db.disconnect()
+
+
+@db_cli.command("check")
+def check_command():
+    """Vérifie le plan de chaque requête (EXPLAIN QUERY PLAN)."""
+    report, absentes = check_query_plans(current_app.config["DATABASE"])
+    failures = 0
+    for nom, hot, statement, plan, problems in report:
+        failed = hot and problems
+        failures += bool(failed)
+        status = "ÉCHEC" if failed else ("scan" if problems else "ok")
+        click.echo(f"[{status}] {nom}: {' '.join(statement.split())}")
+        for detail in plan:
+            click.echo(f"    {detail}")
+    for nom in absentes:
+        click.echo(f"[ÉCHEC] {nom}: méthode absente de _query_workload")
+    if absentes:
+        raise click.ClickException(
+            f"{len(absentes)} méthode(s) de Database non vérifiée(s)."
+        )
+    if failures:
+        raise click.ClickException(
+            f"{failures} requête(s) fréquente(s) parcourent une table "
+            "entière ou trient dans un B-tree temporaire."
+        )
+    click.echo(
+        "Aucune requête fréquente ne parcourt une table entière ni ne trie "
+        "dans un B-tree temporaire."
+    )
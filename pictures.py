@@ -0,0 +1,232 @@
+import hashlib
+import os
+import tempfile
+import time
+
+import click
+from flask import Response, current_app, send_file
+from flask.cli import AppGroup
+
+from .database import BLOB_CHUNK_SIZE, Database
+from .uploads import stream_size
+
+
+class PictureStream:
+    # Iterates over a ProfilPhotos blob in fixed-size chunks. The blob is
+    # only opened on first use, so a response that ends up as a 304 never
+    # touches it. seek() lets werkzeug serve Range requests without
+    # reading the skipped bytes.
+    def __init__(self, database_path, rowid, chunk_size=BLOB_CHUNK_SIZE):
+        self.database_path = database_path
+        self.rowid = rowid
+        self.chunk_size = chunk_size
+        self.db = None
+        self.blob = None
+
+    def _open(self):
+        if self.blob is None:
+            self.db = Database(self.database_path)
+            self.blob = self.db.open_picture(self.rowid)
+        return self.blob
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, origin=0):
+        self._open().seek(offset, origin)
+
+    def tell(self):
+        return self._open().tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self._open().read(self.chunk_size)
+        if not chunk:
+            raise StopIteration
+        return chunk
+
+    def close(self):
+        if self.blob is not None:
+            self.blob.close()
+            self.blob = None
+        if self.db is not None:
+            self.db.disconnect()
+            self.db = None
+
+
+class DatabasePictureStore:
+    # The upload is copied into the BLOB by create_user()/modify_user(),
+    # in the same transaction as the user row.
+    def prepare(self, stream):
+        return ("db", stream, stream_size(stream))
+
+
+class FilePictureStore:
+    # Pictures are stored once per content under root/ab/cd/<sha256>.png;
+    # ProfilPhotos only keeps the digest. Identical uploads share a file.
+    def __init__(self, root, accel_prefix=None):
+        self.root = root
+        self.accel_prefix = accel_prefix
+
+    def relative_path(self, sha256):
+        return os.path.join(sha256[:2], sha256[2:4], f"{sha256}.png")
+
+    def path(self, sha256):
+        return os.path.join(self.root, self.relative_path(sha256))
+
+    def write(self, chunks):
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        taille = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    taille += len(chunk)
+                    tmp.write(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            sha256 = digest.hexdigest()
+            path = self.path(sha256)
+            try:
+                # A fresh mtime keeps `flask pictures gc` away from a file
+                # that a row about to be committed refers to.
+                os.utime(path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            else:
+                os.unlink(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return sha256, taille
+
+    def remove(self, path, cutoff):
+        # The file is moved aside before its mtime is checked again: a
+        # concurrent write() has either refreshed it already, and it is
+        # put back, or finds it gone and writes it again.
+        aside = path + ".gc"
+        try:
+            os.replace(path, aside)
+        except FileNotFoundError:
+            return False
+        if os.path.getmtime(aside) >= cutoff:
+            os.replace(aside, path)
+            return False
+        os.unlink(aside)
+        return True
+
+    def prepare(self, stream):
+        # The file is written first; a file left behind by a failed
+        # transaction is removed by `flask pictures gc`.
+        stream.seek(0)
+        sha256, taille = self.write(
+            iter(lambda: stream.read(BLOB_CHUNK_SIZE), b"")
+        )
+        return ("fichier", sha256, taille)
+
+
+def create_picture_store(config):
+    if config["PICTURE_STORE"] == "database":
+        return DatabasePictureStore()
+    if config["PICTURE_STORE"] == "fichiers":
+        return FilePictureStore(
+            config["PICTURE_DIRECTORY"], config["PICTURE_ACCEL_PREFIX"]
+        )
+    raise ValueError(f"Unknown PICTURE_STORE {config['PICTURE_STORE']}")
+
+
+def picture_response(picture, request, config):
+    rowid, taille, sha256, date_modification, stockage = picture
+    if stockage == "fichier":
+        store = FilePictureStore(
+            config["PICTURE_DIRECTORY"], config["PICTURE_ACCEL_PREFIX"]
+        )
+        if store.accel_prefix:
+            # The front-end server (nginx) sends the file itself.
+            response = Response(mimetype="image/png")
+            response.headers["X-Accel-Redirect"] = (
+                store.accel_prefix.rstrip("/")
+                + "/"
+                + store.relative_path(sha256).replace(os.sep, "/")
+            )
+        else:
+            return send_file(
+                store.path(sha256),
+                mimetype="image/png",
+                etag=sha256,
+                last_modified=date_modification,
+                max_age=config["PICTURE_MAX_AGE"],
+                conditional=True,
+            )
+    else:
+        response = Response(
+            PictureStream(config["DATABASE"], rowid),
+            mimetype="image/png",
+            direct_passthrough=True,
+        )
+        response.content_length = taille
+        response.accept_ranges = "bytes"
+    response.set_etag(sha256)
+    response.last_modified = date_modification
+    response.cache_control.public = True
+    response.cache_control.max_age = config["PICTURE_MAX_AGE"]
+    if stockage == "fichier":
+        return response.make_conditional(request)
+    return response.make_conditional(
+        request, accept_ranges=True, complete_length=taille
+    )
+
+
+pictures_cli = AppGroup("pictures", help="Gestion des photos de profil.")
+
+
+@pictures_cli.command("migrate")
+def migrate_pictures():
+    """Déplace les photos stockées en BLOB vers PICTURE_DIRECTORY."""
+    store = FilePictureStore(current_app.config["PICTURE_DIRECTORY"])
+    db = Database(current_app.config["DATABASE"])
+    try:
+        pictures = db.get_database_pictures()
+        for rowid, pic_id in pictures:
+            with db.open_picture(rowid) as blob:
+                sha256, taille = store.write(
+                    iter(lambda: blob.read(BLOB_CHUNK_SIZE), b"")
+                )
+            db.move_picture_to_file(rowid, sha256)
+            click.echo(f"{pic_id} -> {store.relative_path(sha256)}")
+    finally:
+        db.disconnect()
+    click.echo(f"{len(pictures)} photo(s) déplacée(s).")
+    click.echo("Exécutez VACUUM pour récupérer l'espace dans la base.")
+
+
+@pictures_cli.command("gc")
+def collect_pictures():
+    """Supprime les fichiers qui ne sont plus référencés."""
+    store = FilePictureStore(current_app.config["PICTURE_DIRECTORY"])
+    # Recent files may belong to an upload whose row is not committed yet.
+    cutoff = time.time() - 60 * 60
+    db = Database(current_app.config["DATABASE"])
+    try:
+        digests = db.get_file_picture_digests()
+    finally:
+        db.disconnect()
+    removed = 0
+    for directory, _, files in os.walk(store.root):
+        for name in files:
+            sha256, extension = os.path.splitext(name)
+            path = os.path.join(directory, name)
+            if (
+                extension == ".png"
+                and sha256 not in digests
+                and os.path.getmtime(path) < cutoff
+                and store.remove(path, cutoff)
+            ):
+                removed += 1
+    click.echo(f"{removed} fichier(s) supprimé(s).")
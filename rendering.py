@@ -0,0 +1,146 @@
+import re
+from html import escape
+from html.parser import HTMLParser
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+# Stored with every rendered article. Bump it whenever render_contenu()
+# changes its output, then run `flask articles rendre`.
+RENDERER_VERSION = 2
+
+ALLOWED_TAGS = {
+    "a", "b", "blockquote", "br", "code", "em", "h3", "h4", "i", "li", "ol",
+    "p", "pre", "strong", "u", "ul",
+}
+VOID_TAGS = {"br"}
+# Dropped together with their content.
+DROPPED_TAGS = {
+    "iframe", "noscript", "object", "script", "style", "template",
+    "textarea", "title",
+}
+# Browsers read "/\host" like "//host": both are off-site links.
+SAFE_URL = re.compile(r"^(https?:|mailto:|/(?![/\\])|#)", re.IGNORECASE)
+# Ignored by browsers inside a URL, so removed before it is checked.
+URL_CONTROL = re.compile(r"[\x00-\x20\x7f]")
+BARE_URL = re.compile(r"\bhttps?://[^\s<>\"']+", re.IGNORECASE)
+TRAILING_PUNCTUATION = ".,;:!?)'\""
+
+
+def _link(url, text):
+    return f'<a href="{escape(url)}" rel="nofollow">{escape(text)}</a>'
+
+
+def linkify(text):
+    parts = []
+    position = 0
+    for match in BARE_URL.finditer(text):
+        url = match.group(0).rstrip(TRAILING_PUNCTUATION)
+        parts.append(escape(text[position:match.start()]))
+        parts.append(_link(url, url))
+        position = match.start() + len(url)
+    parts.append(escape(text[position:]))
+    return "".join(parts)
+
+
+class Sanitizer(HTMLParser):
+    # Keeps the whitelisted tags (without attributes, except a safe href),
+    # strips every other tag but keeps its text, and makes bare http(s)
+    # URLs clickable. Unclosed tags are closed at the end.
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.output = []
+        self.open = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.skipping += 1
+            return
+        if self.skipping or tag not in ALLOWED_TAGS:
+            return
+        if tag == "p" and "p" in self.open:
+            # As in HTML, a paragraph ends where the next one starts.
+            self.handle_endtag("p")
+        if tag == "a":
+            href = URL_CONTROL.sub("", dict(attrs).get("href") or "")
+            if SAFE_URL.match(href):
+                self.output.append(
+                    f'<a href="{escape(href)}" rel="nofollow">'
+                )
+            else:
+                self.output.append("<a>")
+        else:
+            self.output.append(f"<{tag}>")
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+            return
+        if self.skipping or tag not in self.open:
+            return
+        while self.open:
+            name = self.open.pop()
+            self.output.append(f"</{name}>")
+            if name == tag:
+                break
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        if "a" in self.open:
+            self.output.append(escape(data))
+        else:
+            self.output.append(linkify(data))
+
+    def close(self):
+        super().close()
+        while self.open:
+            self.output.append(f"</{self.open.pop()}>")
+
+
+def render_contenu(contenu):
+    sanitizer = Sanitizer()
+    sanitizer.feed(contenu or "")
+    sanitizer.close()
+    return "".join(sanitizer.output)
+
+
+articles_cli = AppGroup("articles", help="Rendu des articles.")
+
+
+@articles_cli.command("rendre")
+@click.option("--tout", is_flag=True,
+              help="Rend aussi les articles déjà à la version courante.")
+@click.option("--taille-lot", default=500, show_default=True,
+              help="Articles par transaction.")
+def render_command(tout, taille_lot):
+    """Rend le contenu HTML des articles écrits par un ancien rendu."""
+    from .database import Database
+
+    version = RENDERER_VERSION + 1 if tout else RENDERER_VERSION
+    db = Database(current_app.config["DATABASE"])
+    total = 0
+    try:
+        apres = 0
+        while True:
+            rows = db.get_articles_to_render(version, apres, taille_lot)
+            if not rows:
+                break
+            apres = rows[-1][0]
+            db.save_rendered_articles(
+                [
+                    (rowid, article_id, render_contenu(contenu))
+                    for rowid, article_id, contenu in rows
+                ],
+                RENDERER_VERSION,
+            )
+            total += len(rows)
+    finally:
+        db.disconnect()
+    click.echo(
+        f"{total} article(s) rendu(s) (version {RENDERER_VERSION})."
+    )
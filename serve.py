@@ -0,0 +1,272 @@
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask.cli import pass_script_info
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from .database import get_pool
+from .templating import configure_templates, precompile_templates
+
+# Passed across the exec() of a reload (SIGHUP): the listening socket and
+# the workers running the previous code, to stop once the new ones run.
+LISTENER_FD = "SERVE_LISTENER_FD"
+PREVIOUS_WORKERS = "SERVE_PREVIOUS_WORKERS"
+
+
+def log(message):
+    click.echo(f"[{os.getpid()}] {message}", err=True)
+
+
+class RequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    access_log = False
+
+    def log_request(self, *args, **kwargs):
+        if self.access_log:
+            super().log_request(*args, **kwargs)
+
+    def log_error(self, format, *args):
+        # Idle keep-alive connections end with a timeout; not an error.
+        if not format.startswith("Request timed out"):
+            super().log_error(format, *args)
+
+
+class WorkerServer(BaseWSGIServer):
+    # Accepts on the socket shared by all workers and hands connections to
+    # a fixed pool of threads. A worker whose threads are all busy stops
+    # accepting, leaving the next connections to the other workers.
+    multithread = True
+
+    def __init__(self, host, port, app, fd, threads, keepalive, access_log):
+        handler = type(
+            "RequestHandler",
+            (RequestHandler,),
+            {"timeout": keepalive, "access_log": access_log},
+        )
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        self.executor = ThreadPoolExecutor(threads)
+        self.slots = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.executor.submit(self.process_request_thread, request,
+                             client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+
+def warm(app):
+    # Done once in the master: the workers share these pages with it
+    # (copy-on-write) instead of each building them on first use.
+    configure_templates(app, create=True)
+    precompile_templates(app.jinja_env)
+    assets = app.extensions.get("assets")
+    if assets is not None:
+        assets.load()
+    suggest = app.extensions.get("suggest")
+    if suggest is not None:
+        suggest.load()
+    # Connections must belong to the process that uses them.
+    get_pool(app.config["DATABASE"]).close_all()
+    gc.collect()
+    gc.freeze()
+
+
+def run_worker(app, host, port, fd, threads, keepalive, access_log):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGQUIT, signal.SIG_DFL)
+    server = WorkerServer(host, port, app, fd, threads, keepalive,
+                          access_log)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever(), which runs on this thread.
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    server.serve_forever()
+    # Requests in progress are finished before the process exits.
+    server.executor.shutdown(wait=True)
+    writes = app.extensions.get("writes")
+    if writes is not None:
+        writes.close()
+
+
+class Master:
+    def __init__(self, app, listener, workers, threads, keepalive,
+                 graceful_timeout, access_log):
+        self.app = app
+        self.listener = listener
+        self.host, self.port = listener.getsockname()[:2]
+        self.count = workers
+        self.threads = threads
+        self.keepalive = keepalive
+        self.graceful_timeout = graceful_timeout
+        self.access_log = access_log
+        self.workers = set()
+        self.previous = set()
+        self.stopping = False
+        self.reloading = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers.add(pid)
+            return
+        status = 0
+        try:
+            run_worker(
+                self.app, self.host, self.port, self.listener.fileno(),
+                self.threads, self.keepalive, self.access_log,
+            )
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.workers:
+                self.workers.discard(pid)
+                if not self.stopping:
+                    log(f"processus {pid} terminé ({status}), remplacé.")
+            self.previous.discard(pid)
+
+    def reload(self):
+        # The master exec()s itself: same pid (for the supervisor), new
+        # code, same listening socket. The current workers keep accepting
+        # until the new ones are running.
+        log("rechargement.")
+        fd = self.listener.fileno()
+        os.set_inheritable(fd, True)
+        environ = dict(os.environ)
+        environ[LISTENER_FD] = str(fd)
+        environ[PREVIOUS_WORKERS] = ",".join(
+            str(pid) for pid in self.workers | self.previous
+        )
+        # An ignored signal stays ignored across exec(): another SIGHUP
+        # must not kill the new image before it installs its handler.
+        handler = signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        try:
+            os.execve(sys.executable,
+                      [sys.executable] + sys.orig_argv[1:], environ)
+        except OSError as error:
+            signal.signal(signal.SIGHUP, handler)
+            os.set_inheritable(fd, False)
+            log(f"le rechargement a échoué : {error}")
+
+    def stop(self):
+        self.previous |= self.workers
+        self.workers = set()
+        for pid in self.previous:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.previous and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.previous:
+            os.kill(pid, signal.SIGKILL)
+        while self.previous:
+            pid, _ = os.waitpid(-1, 0)
+            self.previous.discard(pid)
+
+    def run(self, previous=()):
+        def on_stop(signum, frame):
+            self.stopping = True
+
+        def on_reload(signum, frame):
+            self.reloading = True
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGQUIT):
+            signal.signal(signum, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+
+        log(
+            f"{self.count} processus de {self.threads} fil(s) sur "
+            f"http://{self.host}:{self.port}"
+        )
+        while len(self.workers) < self.count:
+            self.spawn()
+        # Workers of the code before a reload: still our children.
+        for pid in previous:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                continue
+            self.previous.add(pid)
+        while not self.stopping:
+            self.reap()
+            if self.reloading:
+                self.reloading = False
+                self.reload()
+            while len(self.workers) < self.count and not self.stopping:
+                self.spawn()
+            time.sleep(0.5)
+        log("arrêt.")
+        self.stop()
+        self.listener.close()
+
+
+def open_listener(host, port, backlog):
+    if LISTENER_FD in os.environ:
+        fd = int(os.environ.pop(LISTENER_FD))
+        listener = socket.socket(fileno=fd)
+        os.set_inheritable(fd, False)
+        return listener
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return socket.create_server((host, port), family=family, backlog=backlog)
+
+
+@click.command("serve")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=5000, show_default=True)
+@click.option("--workers", default=os.cpu_count() or 1, show_default=True,
+              help="Processus.")
+@click.option("--threads", default=8, show_default=True,
+              help="Fils par processus.")
+@click.option("--keepalive", default=2.0, show_default=True,
+              help="Secondes d'attente d'une requête sur une connexion.")
+@click.option("--graceful-timeout", default=30.0, show_default=True,
+              help="Secondes laissées aux requêtes en cours à l'arrêt.")
+@click.option("--backlog", default=2048, show_default=True)
+@click.option("--journal-acces", is_flag=True,
+              help="Écrit chaque requête sur la sortie d'erreur.")
+@pass_script_info
+def serve_command(info, host, port, workers, threads, keepalive,
+                  graceful_timeout, backlog, journal_acces):
+    """Serveur de production multi-processus (SIGHUP pour recharger)."""
+    app = info.load_app()
+    if app.debug:
+        raise click.UsageError(
+            "Le mode debug doit être désactivé (FLASK_DEBUG=0)."
+        )
+    previous = os.environ.pop(PREVIOUS_WORKERS, "")
+    listener = open_listener(host, port, backlog)
+    warm(app)
+    master = Master(app, listener, workers, threads, keepalive,
+                    graceful_timeout, journal_acces)
+    master.run([int(pid) for pid in previous.split(",") if pid])
@@ -0,0 +1,238 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from . import changes
+from .database import Database
+
+
+class SessionBackend(ABC):
+    def __init__(self, idle_timeout, max_age):
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+
+    @abstractmethod
+    def save(self, id_session, username):
+        pass
+
+    @abstractmethod
+    def get(self, id_session):
+        pass
+
+    @abstractmethod
+    def delete(self, id_session):
+        pass
+
+    def sweep(self):
+        return 0
+
+    def is_active(self, id_session):
+        return self.get(id_session) is not None
+
+    def is_expired(self, date_creation, derniere_activite, now):
+        return (
+            now - derniere_activite > self.idle_timeout
+            or now - date_creation > self.max_age
+        )
+
+
+class SQLiteSessionBackend(SessionBackend):
+    def __init__(
+        self,
+        database_path,
+        idle_timeout,
+        max_age,
+        touch_interval=60,
+        batch_size=500,
+        writes=None,
+    ):
+        super().__init__(idle_timeout, max_age)
+        self.database_path = database_path
+        # WriteQueue in write-behind mode. Logins and logouts wait for
+        # their commit; expirations and activity updates do not.
+        self.writes = writes
+        # derniere_activite is only rewritten once per interval so that
+        # an active session does not cost one write per request.
+        self.touch_interval = touch_interval
+        self.batch_size = batch_size
+
+    def _write(self, method, *args):
+        if self.writes is not None:
+            return self.writes.submit(method, *args).result(
+                self.writes.timeout
+            )
+        db = Database(self.database_path)
+        try:
+            return getattr(db, method)(*args)
+        finally:
+            db.disconnect()
+
+    def save(self, id_session, username):
+        self._write("save_session", id_session, username)
+
+    def load(self, id_session):
+        now = time.time()
+        db = Database(self.database_path)
+        try:
+            record = db.get_session_record(id_session)
+            if record is None:
+                return None
+            username, date_creation, derniere_activite = record
+            if self.is_expired(date_creation, derniere_activite, now):
+                if self.writes is not None:
+                    self.writes.submit("delete_session", id_session)
+                else:
+                    db.delete_session(id_session)
+                return None
+            if now - derniere_activite > self.touch_interval:
+                if self.writes is not None:
+                    self.writes.submit("touch_session", id_session, now)
+                else:
+                    db.touch_session(id_session, now)
+            return username, date_creation
+        finally:
+            db.disconnect()
+
+    def get(self, id_session):
+        record = self.load(id_session)
+        if record is None:
+            return None
+        return record[0]
+
+    def delete(self, id_session):
+        self._write("delete_session", id_session)
+
+    def sweep(self):
+        now = time.time()
+        deleted = 0
+        db = Database(self.database_path)
+        try:
+            # Small batches keep each write transaction short so that
+            # logins are never blocked behind a large purge.
+            while True:
+                count = db.delete_expired_sessions(
+                    now - self.idle_timeout,
+                    now - self.max_age,
+                    self.batch_size,
+                )
+                deleted += count
+                if count < self.batch_size:
+                    return deleted
+        finally:
+            db.disconnect()
+
+
+class MemorySessionBackend(SessionBackend):
+    # Sessions are cached in process for at most `ttl` seconds. Writes go
+    # through to `store` and invalidate the local entry; other processes
+    # drop it when they replay the deletion from change_log.
+    def __init__(self, store, ttl=30, maxsize=10000):
+        super().__init__(store.idle_timeout, store.max_age)
+        self.store = store
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        changes.session_deleted.connect(self.on_session_deleted)
+        changes.changes_lost.connect(self.on_changes_lost)
+
+    def on_session_deleted(self, id_session):
+        with self._lock:
+            self._entries.pop(id_session, None)
+
+    def on_changes_lost(self, feed):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, id_session, username, date_creation, now):
+        with self._lock:
+            self._entries[id_session] = [username, date_creation, now, now]
+            self._entries.move_to_end(id_session)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def save(self, id_session, username):
+        self.store.save(id_session, username)
+        now = time.time()
+        self._remember(id_session, username, now, now)
+
+    def get(self, id_session):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(id_session)
+            if entry is not None:
+                username, date_creation, derniere_activite, cached_at = entry
+                if self.is_expired(date_creation, derniere_activite, now):
+                    del self._entries[id_session]
+                elif now - cached_at < self.ttl:
+                    entry[2] = now
+                    self._entries.move_to_end(id_session)
+                    self.hits += 1
+                    return username
+                else:
+                    del self._entries[id_session]
+            self.misses += 1
+        record = self.store.load(id_session)
+        if record is None:
+            return None
+        username, date_creation = record
+        self._remember(id_session, username, date_creation, now)
+        return username
+
+    def delete(self, id_session):
+        with self._lock:
+            self._entries.pop(id_session, None)
+        self.store.delete(id_session)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [
+                id_session
+                for id_session, entry in self._entries.items()
+                if self.is_expired(entry[1], entry[2], now)
+            ]
+            for id_session in expired:
+                del self._entries[id_session]
+        return self.store.sweep()
+
+
+class SessionSweeper(threading.Thread):
+    def __init__(self, backend, interval):
+        super().__init__(name="session-sweeper", daemon=True)
+        self.pid = os.getpid()
+        self.backend = backend
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.backend.sweep()
+            except sqlite3.OperationalError:
+                # A locked database only delays the purge to the next run.
+                pass
+
+    def stop(self):
+        self.stopped.set()
+
+
+def create_session_backend(config, writes=None):
+    store = SQLiteSessionBackend(
+        config["DATABASE"],
+        config["SESSION_IDLE_TIMEOUT"],
+        config["SESSION_MAX_AGE"],
+        writes=writes,
+    )
+    if config["SESSION_BACKEND"] == "memory":
+        return MemorySessionBackend(
+            store, config["SESSION_CACHE_TTL"], config["SESSION_CACHE_SIZE"]
+        )
+    if config["SESSION_BACKEND"] == "sqlite":
+        return store
+    raise ValueError(f"Unknown SESSION_BACKEND {config['SESSION_BACKEND']}")
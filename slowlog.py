@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+from flask import has_request_context, request
+
+IGNORED_PREFIXES = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE",
+                    "PRAGMA", "EXPLAIN")
+
+
+def parameter_shapes(parameters):
+    # Types and sizes only: values may be passwords or session ids.
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}({len(value)})"
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return {key: shape(value) for key, value in parameters.items()}
+    return [shape(value) for value in parameters]
+
+
+def calling_method():
+    # The Database method that ran the statement, found on the stack.
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_filename.endswith("database.py") and (
+            "self" in frame.f_locals
+        ):
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return None
+
+
+class SlowQueryLog:
+    # Statements slower than `threshold` seconds, with their query plan,
+    # appended to a JSONL file rotated at `max_bytes`.
+    def __init__(self, path, threshold, max_bytes=5 * 1024 * 1024,
+                 backups=3):
+        self.path = path
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+
+    def record(self, connection, sql, parameters, elapsed, many=False):
+        statement = sql.lstrip().upper()
+        if statement.startswith(IGNORED_PREFIXES):
+            return
+        if many:
+            parameters = next(iter(parameters), ())
+        entry = {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "duree_ms": round(elapsed * 1000, 3),
+            "sql": " ".join(sql.split()),
+            "parametres": parameter_shapes(parameters),
+            "plusieurs": many,
+            "methode": calling_method(),
+            "route": None,
+            "pid": os.getpid(),
+        }
+        if has_request_context():
+            entry["route"] = f"{request.method} {request.endpoint}"
+        try:
+            entry["plan"] = [
+                row[3]
+                for row in sqlite3.Connection.execute(
+                    connection, "EXPLAIN QUERY PLAN " + sql, parameters
+                )
+            ]
+        except sqlite3.Error as error:
+            entry["plan"] = None
+            entry["erreur_plan"] = str(error)
+        self.write(json.dumps(entry, ensure_ascii=False))
+
+    def write(self, line):
+        data = (line + "\n").encode("utf-8")
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                size = 0
+            if size and size + len(data) > self.max_bytes:
+                self.rotate()
+            with open(self.path, "ab") as fichier:
+                fichier.write(data)
+
+    def rotate(self):
+        for n in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{n}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{n + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.unlink(self.path)
+
+    def recent(self, limit=100):
+        try:
+            with open(self.path, encoding="utf-8") as fichier:
+                lines = deque(fichier, maxlen=limit)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for line in reversed(lines):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+
+class TracedCursor(sqlite3.Cursor):
+    # Times a statement from execute() to its last fetch, since SQLite
+    # only steps through the rows as they are fetched, and hands it to
+    # the pool's slow query log when it is over the threshold.
+    _statement = None
+    _elapsed = 0
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def _start(self, method, sql, parameters, many):
+        self._finish()
+        self._statement = (sql, parameters, many)
+        self._elapsed = 0
+        return self._timed(method, sql, parameters)
+
+    def _finish(self):
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        log = getattr(self.connection, "slow_log", None)
+        if log is not None and self._elapsed >= log.threshold:
+            sql, parameters, many = statement
+            log.record(self.connection, sql, parameters, self._elapsed, many)
+
+    def execute(self, sql, parameters=()):
+        return self._start(super().execute, sql, parameters, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        return self._start(super().executemany, sql, seq_of_parameters, True)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TracedConnection(sqlite3.Connection):
+    # sqlite3.Connection.execute() does not go through cursor(), so the
+    # shortcuts are redirected to TracedCursor here.
+    slow_log = None
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -81,6 +81,52 @@ function submitRechercheForm(event) {
   }
 }
 
+var suggestTimer = null;
+var suggestRequest = null;
+
+function showSuggestions(suggestions) {
+  var list = document.getElementById("suggestions");
+  list.textContent = "";
+  suggestions.forEach(function (suggestion) {
+    var item = document.createElement("li");
+    var link = document.createElement("a");
+    link.href = suggestion.url;
+    link.textContent = suggestion.titre;
+    item.appendChild(link);
+    list.appendChild(item);
+  });
+}
+
+function fetchSuggestions(query) {
+  if (suggestRequest) {
+    suggestRequest.abort();
+    suggestRequest = null;
+  }
+  if (query.trim().length === 0) {
+    showSuggestions([]);
+    return;
+  }
+  suggestRequest = new AbortController();
+  fetch("/recherche/suggest?q=" + encodeURIComponent(query), {
+    signal: suggestRequest.signal,
+  })
+    .then(function (response) {
+      return response.json();
+    })
+    .then(function (data) {
+      showSuggestions(data.suggestions);
+    })
+    .catch(function () {});
+}
+
+function inputRecherche(event) {
+  var query = event.target.value;
+  clearTimeout(suggestTimer);
+  suggestTimer = setTimeout(function () {
+    fetchSuggestions(query);
+  }, 150);
+}
+
 function submitNewUser(event) {
   event.preventDefault();
   var form = document.getElementById("creer-utilisateur");
@@ -254,4 +300,9 @@ document.addEventListener("DOMContentLoaded", function () {
   if (rechercheForm) {
     rechercheForm.addEventListener("submit", submitRechercheForm);
   }
+
+  var rechercheInput = document.getElementById("recherche");
+  if (rechercheInput && document.getElementById("suggestions")) {
+    rechercheInput.addEventListener("input", inputRecherche);
+  }
 });
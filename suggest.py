@@ -0,0 +1,165 @@
+import bisect
+import re
+import threading
+import unicodedata
+from datetime import date
+
+from . import changes
+from .database import Database
+
+WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    # Case and accents are ignored: "ete" finds "Été".
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(WORD.findall(text))
+
+
+def title_keys(titre):
+    # One key per word, from that word to the end of the title, so that a
+    # prefix of any word (or of several words) is found with a bisect.
+    text = normalize(titre)
+    return [text[match.start():] for match in WORD.finditer(text)]
+
+
+class TitleIndex:
+    # Titles of all articles as sorted (key, id) pairs, kept up to date from
+    # the article-changed signal. `flask serve` loads it before forking so
+    # that workers share it; elsewhere it is loaded on first use. Scheduled
+    # articles are indexed but only suggested once their date has come.
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.last_rowid = None
+        self._keys = []
+        self._articles = {}
+        self._lock = threading.Lock()
+        # While rebuilding: ids changed since, and lost feeds seen.
+        self._missed = None
+        self._lost = 0
+        changes.article_changed.connect(self.on_article_changed)
+        changes.changes_lost.connect(self.on_changes_lost)
+
+    def _remove(self, article_id):
+        entry = self._articles.pop(article_id, None)
+        if entry is None:
+            return
+        for key in entry[2]:
+            i = bisect.bisect_left(self._keys, (key, article_id))
+            if i < len(self._keys) and self._keys[i] == (key, article_id):
+                del self._keys[i]
+
+    def _add(self, rowid, article_id, titre, date_publication):
+        self._remove(article_id)
+        keys = title_keys(titre)
+        self._articles[article_id] = (titre, date_publication, keys)
+        for key in keys:
+            bisect.insort(self._keys, (key, article_id))
+        if rowid > self.last_rowid:
+            self.last_rowid = rowid
+
+    def _read(self):
+        db = Database(self.database_path)
+        try:
+            rows = db.get_article_titles()
+        finally:
+            db.disconnect()
+        last_rowid = 0
+        keys = []
+        articles = {}
+        for rowid, article_id, titre, date_publication in rows:
+            entry = (titre, date_publication, title_keys(titre))
+            articles[article_id] = entry
+            keys.extend((key, article_id) for key in entry[2])
+            last_rowid = max(last_rowid, rowid)
+        keys.sort()
+        return keys, articles, last_rowid
+
+    def load(self):
+        with self._lock:
+            if self.last_rowid is not None:
+                return
+            self._keys, self._articles, self.last_rowid = self._read()
+
+    def on_article_changed(self, article_id):
+        # A batch import only publishes its last article, so the rows
+        # inserted since the last update are read as well.
+        if self.last_rowid is None:
+            return
+        with self._lock:
+            if self._missed is not None:
+                self._missed.add(article_id)
+        db = Database(self.database_path)
+        try:
+            row = db.get_article_title(article_id)
+            rows = db.get_article_titles(self.last_rowid)
+        finally:
+            db.disconnect()
+        with self._lock:
+            if self.last_rowid is None:
+                return
+            if row is None:
+                self._remove(article_id)
+            else:
+                self._add(*row)
+            for row in rows:
+                self._add(*row)
+
+    def on_changes_lost(self, feed):
+        # Rebuilt from the table in the background; suggestions keep using
+        # the current index meanwhile, not the request that noticed.
+        with self._lock:
+            if self.last_rowid is None:
+                return
+            self._lost += 1
+            if self._missed is not None:
+                return
+            self._missed = set()
+        threading.Thread(
+            target=self._rebuild, name="title-index", daemon=True
+        ).start()
+
+    def _rebuild(self):
+        try:
+            while True:
+                lost = self._lost
+                keys, articles, last_rowid = self._read()
+                with self._lock:
+                    self._keys = keys
+                    self._articles = articles
+                    self.last_rowid = last_rowid
+                    # Read again if changes were lost during the read.
+                    if lost == self._lost:
+                        missed, self._missed = self._missed, None
+                        break
+        except Exception:
+            with self._lock:
+                self._missed = None
+                self.last_rowid = None
+            raise
+        # Changed during the read: the new index may predate them.
+        for article_id in missed:
+            self.on_article_changed(article_id)
+
+    def suggest(self, prefix, limit):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self.load()
+        today = date.today().isoformat()
+        suggestions = []
+        seen = set()
+        with self._lock:
+            i = bisect.bisect_left(self._keys, (prefix,))
+            while i < len(self._keys) and len(suggestions) < limit:
+                key, article_id = self._keys[i]
+                if not key.startswith(prefix):
+                    break
+                i += 1
+                titre, date_publication, _ = self._articles[article_id]
+                if article_id in seen or date_publication > today:
+                    continue
+                seen.add(article_id)
+                suggestions.append((article_id, titre))
+        return suggestions
@@ -0,0 +1,40 @@
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+
+
+def configure_templates(app, create=False):
+    # Compiled templates are shared on disk by every worker process, so
+    # only the first process after a deploy pays for the compilation.
+    # Importing the app only uses an existing cache; it is created by
+    # `flask templates compile` and `flask serve`.
+    directory = app.config["TEMPLATE_CACHE_DIRECTORY"]
+    if create:
+        os.makedirs(directory, exist_ok=True)
+    elif not os.path.isdir(directory):
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def precompile_templates(env):
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+templates_cli = AppGroup("templates", help="Gabarits Jinja.")
+
+
+@templates_cli.command("compile")
+def compile_command():
+    """Compile tous les gabarits dans le cache de bytecode."""
+    configure_templates(current_app, create=True)
+    names = precompile_templates(current_app.jinja_env)
+    click.echo(
+        f"{len(names)} gabarit(s) compilé(s) dans "
+        f"{current_app.config['TEMPLATE_CACHE_DIRECTORY']}."
+    )
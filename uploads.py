@@ -0,0 +1,47 @@
+import os
+import struct
+
+from flask import Request, current_app
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_MAX_CHUNK = 2**31 - 1
+
+
+class UploadRequest(Request):
+    # Flask only applies MAX_CONTENT_LENGTH; the text fields of a form are
+    # bounded too. Files are spooled to disk by werkzeug past 500 Ko.
+    @property
+    def max_form_memory_size(self):
+        return current_app.config["MAX_FORM_MEMORY_SIZE"]
+
+
+def stream_size(stream):
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(0)
+    return size
+
+
+def is_valid_png(stream, size):
+    # Only the signature and the chunk headers are read; the data and CRC
+    # of each chunk are skipped with seek(). The file must start with
+    # IHDR and end exactly after IEND.
+    stream.seek(0)
+    if stream.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        return False
+    position = len(PNG_SIGNATURE)
+    first = True
+    while position + 12 <= size:
+        header = stream.read(8)
+        if len(header) < 8:
+            return False
+        length, kind = struct.unpack(">I4s", header)
+        if length > PNG_MAX_CHUNK or not kind.isalpha():
+            return False
+        if first and (kind != b"IHDR" or length != 13):
+            return False
+        first = False
+        position += 12 + length
+        if kind == b"IEND":
+            return length == 0 and position == size
+        stream.seek(position)
+    return False
@@ -0,0 +1,114 @@
+import re
+
+from flask import current_app
+
+from .uploads import is_valid_png, stream_size
+
+
+def valider_recherche(recherche):
+    if len(recherche) < 3:
+        return "La recherche doit contenir au moins 3 caractères."
+
+
+def valider_article(titre, date_publication, contenu):
+    erreurs = {}
+
+    if not titre or len(titre) > 50:
+        erreurs["titre"] = "Le titre doit contenir entre 1 et 50 caractères."
+
+    if not is_valid_date(date_publication):
+        erreurs["date_publication"] = "Date de publication invalide."
+
+    if not contenu or len(contenu) > 500:
+        erreurs["contenu"] = "Le contenu doit contenir de 1 à 500 caractères."
+
+    return erreurs
+
+
+def valider_modification_article(titre, contenu):
+    erreurs = {}
+
+    if not titre or len(titre) > 50:
+        erreurs["titre"] = "Le titre doit contenir entre 1 et 50 caractères."
+
+    if not contenu or len(contenu) > 500:
+        erreurs["contenu"] = "Le contenu doit contenir de 1 à 500 caractères."
+
+    return erreurs
+
+
+def valider_user(username, password, prenom, nom, courriel, photo):
+    erreurs = {}
+    if valider_username(username) is not None:
+        erreurs["username"] = valider_username(username)
+
+    if not password or len(password) > 25 or len(password) < 3:
+        erreurs["password"] = "Le password doit contenir de 3 à 25 caractères."
+
+    if not nom or len(nom) > 20 or len(nom) < 3:
+        erreurs["nom"] = "Le nom doit contenir entre 3 et 20 caractères."
+
+    if not prenom or len(prenom) > 20 or len(prenom) < 3:
+        erreurs["prenom"] = "Le prenom doit contenir de 3 à 20 caractères."
+
+    if valider_photo(photo) is not None:
+        erreurs["photo"] = valider_photo(photo)
+
+    if is_courriel_valide(courriel) is not None:
+        erreurs["courriel"] = is_courriel_valide(courriel)
+
+    return erreurs
+
+
+def valider_user_modifier(password, prenom, nom, courriel, photo):
+    erreurs = {}
+
+    if not password or len(password) > 25 or len(password) < 3:
+        erreurs["password"] = "Le password doit contenir de 3 à 25 caractères."
+
+    if not nom or len(nom) > 20 or len(nom) < 3:
+        erreurs["nom"] = "Le nom doit contenir entre 3 et 20 caractères."
+
+    if not prenom or len(prenom) > 20 or len(prenom) < 3:
+        erreurs["prenom"] = "Le prenom doit contenir de 3 à 20 caractères."
+
+    if valider_photo(photo) is not None:
+        erreurs["photo"] = valider_photo(photo)
+
+    if is_courriel_valide(courriel) is not None:
+        erreurs["courriel"] = is_courriel_valide(courriel)
+
+    return erreurs
+
+
+# Uniqueness is checked by create_user() itself, in the INSERT.
+def valider_username(username):
+    if not username or len(username) > 25 or len(username) < 3:
+        return "Le username doit contenir entre 3 et 25 caractères."
+
+
+def is_courriel_valide(courriel):
+    if not courriel or len(courriel) > 100:
+        return "Le courriel doit avoir moins de 100 caractères."
+    elif not re.match(r"[^@]+@[^@]+\.[^@]+", courriel):
+        return "Le courriel doit avoir le format exemple@hotmail.com."
+
+
+def valider_photo(photo):
+    if photo is None:
+        return None
+    taille = stream_size(photo.stream)
+    if taille > current_app.config["PICTURE_MAX_SIZE"]:
+        limite = current_app.config["PICTURE_MAX_SIZE"] // 1024
+        return f"La photo de profil ne doit pas dépasser {limite} Ko."
+    if not is_valid_png(photo.stream, taille):
+        return "La photo de profil doit être une image png valide."
+
+
+def is_valid_date(date_str):
+    date_pattern = r"^\d{4}-\d{2}-\d{2}$"
+
+    if re.search(date_pattern, date_str):
+        return True
+    else:
+        return False
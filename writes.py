@@ -0,0 +1,160 @@
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+from . import changes
+from .database import Database
+
+
+class WriteQueue:
+    # Write-behind mode: request threads queue Database write methods and
+    # a single writer thread runs them, many per transaction, so that a
+    # burst of writes takes the SQLite writer lock and pays for a commit
+    # once. A group is committed at most `max_delay` seconds after its
+    # first write. submit() returns a Future resolved after the commit;
+    # callers wait for it at most `timeout` seconds.
+    def __init__(self, database_path, max_delay=0.005, max_batch=256,
+                 timeout=10):
+        self.database_path = database_path
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.pid = None
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # Threads do not survive fork(); each worker process starts its own.
+        with self._lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(self._queue,),
+                    name="write-queue",
+                    daemon=True,
+                )
+                self._thread.start()
+            return self._queue
+
+    def submit(self, method, *args):
+        future = Future()
+        self._ensure_thread().put((future, method, args))
+        return future
+
+    def close(self, timeout=None):
+        with self._lock:
+            if self.pid != os.getpid():
+                return
+            self._queue.put(None)
+            thread = self._thread
+        thread.join(timeout)
+
+    def _collect(self, jobs_queue):
+        job = jobs_queue.get()
+        if job is None:
+            return [], True
+        jobs = [job]
+        deadline = time.monotonic() + self.max_delay
+        while len(jobs) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    job = jobs_queue.get(timeout=remaining)
+                else:
+                    job = jobs_queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                return jobs, True
+            jobs.append(job)
+        return jobs, False
+
+    def _run(self, jobs_queue):
+        db = Database(self.database_path)
+        try:
+            stopped = False
+            while not stopped:
+                jobs, stopped = self._collect(jobs_queue)
+                if not jobs:
+                    continue
+                # The thread must outlive any error: later writes would
+                # otherwise wait on a queue that nobody reads.
+                try:
+                    self._write(db, jobs)
+                except Exception as error:
+                    traceback.print_exc()
+                    _fail(jobs, error)
+        finally:
+            db.disconnect()
+
+    def _write(self, db, jobs):
+        connection = db.get_connection()
+        db.pending_changes = []
+        results = []
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for future, method, args in jobs:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                # A failing write only undoes itself, not its whole group.
+                connection.execute("SAVEPOINT ecriture")
+                try:
+                    results.append((future, getattr(db, method)(*args), None))
+                except Exception as error:
+                    connection.execute("ROLLBACK TO ecriture")
+                    results.append((future, None, error))
+                connection.execute("RELEASE ecriture")
+            connection.commit()
+        except Exception as error:
+            if connection.in_transaction:
+                connection.rollback()
+            # Including the futures not started when BEGIN failed.
+            _fail(jobs, error)
+            return
+        finally:
+            modifications, db.pending_changes = db.pending_changes, None
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        for sujet, cle in modifications:
+            # The writes are committed; a failing receiver only misses
+            # this change, the other workers replay it from change_log.
+            try:
+                changes.publish(sujet, str(cle))
+            except Exception:
+                traceback.print_exc()
+
+
+def _fail(jobs, error):
+    for future, _, _ in jobs:
+        if not future.done():
+            future.set_exception(error)
+
+
+def write(writes, db, method, *args):
+    # Runs a Database write method through `writes` in write-behind mode,
+    # right away on `db` otherwise. Either way the result is a Future.
+    if writes is not None:
+        return writes.submit(method, *args)
+    future = Future()
+    future.set_result(getattr(db, method)(*args))
+    return future
+
+
+def create_write_queue(config):
+    if not config["WRITE_BEHIND"]:
+        return None
+    return WriteQueue(
+        config["DATABASE"],
+        config["WRITE_BEHIND_DELAY"],
+        config["WRITE_BEHIND_BATCH"],
+        config["WRITE_BEHIND_TIMEOUT"],
+    )